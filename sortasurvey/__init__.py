@@ -1,12 +1,23 @@
 import os
 
+from .aggregate import *
+from .bundle import *
+from .filters import *
+from .index import *
 from .observing import *
 from .pipeline import *
 from .sample import *
+from .sampler import *
+from .shared import *
+from .state import *
+from .streams import *
 from .survey import *
+from .tables import *
+from .track import *
 from .utils import *
+from .writer import *
 
-__all__ = ['cli', 'observing', 'pipeline', 'sample', 'survey', 'utils']
+__all__ = ['aggregate', 'bundle', 'cli', 'filters', 'index', 'observing', 'pipeline', 'sample', 'sampler', 'shared', 'state', 'streams', 'survey', 'tables', 'track', 'utils', 'writer']
 
 __version__ = '1.1.1'
 
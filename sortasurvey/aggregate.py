@@ -0,0 +1,199 @@
+import numpy as np
+import pandas as pd
+
+
+
+
+class P2Quantile:
+    """
+    Streaming estimate of a quantile using the P-squared algorithm (Jain & Chlamtac 1985),
+    which only keeps 5 markers regardless of the number of observations. The estimate is
+    exact for up to 5 observations.
+
+    Parameters
+    ----------
+    p : float
+        the quantile to estimate (e.g. `0.5` for the median)
+
+    """
+
+    __slots__ = ['p', 'n', 'heights', 'positions', 'desired', 'increments']
+
+    def __init__(self, p=0.5):
+        self.p, self.n = p, 0
+        self.heights = []
+        self.positions = [1., 2., 3., 4., 5.]
+        self.desired = [1., 1.+2.*p, 1.+4.*p, 3.+2.*p, 5.]
+        self.increments = [0., p/2., p, (1.+p)/2., 1.]
+
+
+    def update(self, x):
+        x = float(x)
+        self.n += 1
+        if self.n <= 5:
+            self.heights.append(x)
+            self.heights.sort()
+            return
+        q, n = self.heights, self.positions
+        if x < q[0]:
+            q[0], k = x, 0
+        elif x >= q[4]:
+            q[4], k = max(q[4], x), 3
+        else:
+            k = next(i for i in range(4) if q[i] <= x < q[i+1])
+        for i in range(k+1, 5):
+            n[i] += 1.
+        for i in range(5):
+            self.desired[i] += self.increments[i]
+        # adjust the heights of the middle markers
+        for i in range(1, 4):
+            d = self.desired[i] - n[i]
+            if (d >= 1. and n[i+1]-n[i] > 1.) or (d <= -1. and n[i-1]-n[i] < -1.):
+                d = 1. if d > 0. else -1.
+                height = q[i] + d/(n[i+1]-n[i-1])*((n[i]-n[i-1]+d)*(q[i+1]-q[i])/(n[i+1]-n[i]) + (n[i+1]-n[i]-d)*(q[i]-q[i-1])/(n[i]-n[i-1]))
+                if not q[i-1] < height < q[i+1]:
+                    j = i+int(d)
+                    height = q[i] + d*(q[j]-q[i])/(n[j]-n[i])
+                q[i], n[i] = height, n[i]+d
+
+
+    @property
+    def value(self):
+        if not self.n:
+            return np.nan
+        if self.n <= 5:
+            return float(np.percentile(self.heights, 100.*self.p))
+        return self.heights[2]
+
+
+class RankingAggregator:
+    """
+    Online summary of the final priorities of targets across MC iterations (see
+    `utils.emcee_rankings`). Every iteration's prioritized list (i.e. survey.observed)
+    is folded in as soon as it is made, so that the memory only depends on the number
+    of targets that were ever selected and not on the number of iterations. For every
+    target, it keeps the selection count, running mean (and variance) of its priority,
+    a streaming estimate of its median priority and the number of selections per program.
+
+    Parameters
+    ----------
+    programs : List[str]
+        the programs in the survey
+
+    Attributes
+    ----------
+    iterations : int
+        number of iterations that were folded in
+    targets : Dict[int,dict]
+        the running summary of every selected target, keyed by its TOI
+
+    """
+
+    def __init__(self, programs):
+        self.programs = list(programs)
+        self.ids = {program:j for j, program in enumerate(self.programs)}
+        self.iterations = 0
+        self.targets = {}
+
+
+    def update(self, observed):
+        """
+        Folds in the prioritized list of a single iteration.
+
+        Parameters
+        ----------
+        observed : pandas.DataFrame
+            the final prioritized list of an iteration (see `utils.assign_priorities`)
+
+        """
+        self.iterations += 1
+        for tic, toi, priority, programs in zip(observed.tic.values.tolist(), observed.toi.values.tolist(),
+                                                observed.overall_priority.values.tolist(), observed.programs.values.tolist()):
+            if toi not in self.targets:
+                self.targets[toi] = {'tic':tic, 'n_select':0, 'mean':0., 'm2':0., 'median':P2Quantile(0.5),
+                                     'programs':np.zeros(len(self.programs), dtype='int64')}
+            target = self.targets[toi]
+            target['n_select'] += 1
+            # Welford's update of the mean and variance
+            delta = priority - target['mean']
+            target['mean'] += delta/target['n_select']
+            target['m2'] += delta*(priority - target['mean'])
+            target['median'].update(priority)
+            for program in set(programs):
+                if program in self.ids:
+                    target['programs'][self.ids[program]] += 1
+
+
+    def get_errors(self):
+        """
+        Standard errors of the selection probability and (relative) mean priority of every target.
+
+        Returns
+        -------
+        select : numpy.ndarray
+            standard error of the selection probability, i.e. sqrt(p*(1-p)/iterations)
+        priority : numpy.ndarray
+            standard error of the mean priority relative to the mean priority (`nan` if the target was selected once)
+
+        """
+        n = np.array([target['n_select'] for target in self.targets.values()], dtype=float)
+        p = n/max(self.iterations, 1)
+        select = np.sqrt(p*(1.-p)/max(self.iterations, 1))
+        m2 = np.array([target['m2'] for target in self.targets.values()], dtype=float)
+        mean = np.array([target['mean'] for target in self.targets.values()], dtype=float)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            priority = np.where(n > 1, np.sqrt(m2/(n-1.))/np.sqrt(n)/mean, np.nan)
+        return select, priority
+
+
+    def converged(self, tol, min_iter=10):
+        """
+        Checks whether the MC summary has converged, i.e. the standard errors of the
+        selection probabilities (absolute) and of the mean priorities (relative) of all
+        targets are below the tolerance. Mean priorities are only checked for targets
+        that were selected at least `min_iter` times, and at least `min_iter` iterations
+        are needed.
+
+        Parameters
+        ----------
+        tol : float
+            the tolerance on the standard errors
+        min_iter : int
+            minimum number of iterations (and selections) for the estimates to be trusted
+
+        Returns
+        -------
+        converged : bool
+            `True` if all standard errors are below the tolerance
+
+        """
+        if self.iterations < min_iter or not self.targets:
+            return False
+        select, priority = self.get_errors()
+        n = np.array([target['n_select'] for target in self.targets.values()])
+        priority = priority[n >= min_iter]
+        return bool(np.max(select) < tol and (not len(priority) or np.nanmax(priority) < tol))
+
+
+    def to_frame(self):
+        """
+        Summarizes the selected targets across all iterations, sorted by their mean priority.
+
+        Returns
+        -------
+        df : pandas.DataFrame
+            the TOI, TIC, selection count (and fraction), mean, standard deviation and median
+            priority, the number of selections per program and the total number of program selections
+
+        """
+        columns = ['toi', 'tic', 'n_select', 'fraction', 'mean', 'std', 'median'] + self.programs + ['other_programs']
+        rows = []
+        for toi, target in self.targets.items():
+            n = target['n_select']
+            std = np.sqrt(target['m2']/(n-1)) if n > 1 else 0.
+            rows.append([toi, target['tic'], n, round(n/self.iterations, 3), round(target['mean'], 2), round(std, 2),
+                         int(np.round(target['median'].value))] + target['programs'].tolist() + [int(np.sum(target['programs']))])
+        df = pd.DataFrame(rows, columns=columns)
+        df = df.sort_values(by=['mean', 'toi'], ascending=[True, True]).reset_index(drop=True)
+        df.index += 1
+        return df
@@ -0,0 +1,149 @@
+import json
+import zipfile
+import numpy as np
+import pandas as pd
+
+
+
+
+class ResultBundle:
+    """
+    Consolidated (single file) archive of the data products of all MC iterations, which
+    replaces the per-iteration directories of small csvs. The bundle is a NPZ (i.e. zip)
+    file that is appended to after every iteration, where every column of a data product
+    is stored as a separate `.npy` member, i.e. '<product>/<iteration>/<column>.npy'. A
+    single iteration or column (e.g. a program) can therefore be loaded without reading
+    the rest of the bundle, and `numpy.load` works on the bundle as well.
+
+    Parameters
+    ----------
+    path : str
+        path of the bundle (e.g. 'results/<run>/mc_results.npz')
+    mode : str
+        'a' to append to (or create) the bundle and 'r' to only read it (default is 'a')
+
+    Attributes
+    ----------
+    zip : zipfile.ZipFile
+        the open bundle
+
+    """
+
+    def __init__(self, path, mode='a'):
+        self.path = path
+        self.zip = zipfile.ZipFile(path, mode, compression=zipfile.ZIP_STORED, allowZip64=True)
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *args):
+        self.close()
+
+
+    def add(self, n, name, df):
+        """
+        Appends a data product of the nth iteration to the bundle. Numeric and boolean
+        columns are stored as-is and all other columns are stored as strings.
+
+        Parameters
+        ----------
+        n : int
+            iteration number
+        name : str
+            name of the data product (e.g. 'ranking_steps')
+        df : pandas.DataFrame
+            the data product
+
+        """
+        columns = [str(column) for column in df.columns.values.tolist()]
+        self.put('%s/%d/columns.json'%(name, n), json.dumps(columns).encode())
+        for column in columns:
+            values = df[column].values
+            if values.dtype.kind not in 'biuf':
+                values = np.array([str(value) for value in values.tolist()], dtype=str)
+            with self.zip.open('%s/%d/%s.npy'%(name, n, column), 'w', force_zip64=True) as f:
+                np.save(f, values, allow_pickle=False)
+
+
+    def add_text(self, n, name, text):
+        """
+        Appends a text product (e.g. 'run_info') of the nth iteration to the bundle.
+
+        """
+        self.put('%s/%d.txt'%(name, n), text.encode())
+
+
+    def put(self, member, data):
+        with self.zip.open(member, 'w') as f:
+            f.write(data)
+
+
+    def iterations(self, name):
+        """
+        Returns the (sorted) iterations that are in the bundle for a data product.
+
+        """
+        iterations = set()
+        for member in self.zip.namelist():
+            parts = member.split('/')
+            if parts[0] == name and len(parts) == 3:
+                iterations.add(int(parts[1]))
+        return sorted(iterations)
+
+
+    def read(self, name, n=None, columns=None):
+        """
+        Loads a data product from the bundle, with an added 'iteration' column.
+
+        Parameters
+        ----------
+        name : str
+            name of the data product (e.g. 'ranking_steps')
+        n : Optional[Union[int,List[int]]]
+            the iteration(s) to load (default is all iterations)
+        columns : Optional[List[str]]
+            the columns to load (default is all columns)
+
+        Returns
+        -------
+        df : pandas.DataFrame
+            the data product of the requested iterations
+
+        """
+        if n is None:
+            n = self.iterations(name)
+        dfs = []
+        for iteration in np.atleast_1d(n).tolist():
+            names = json.loads(self.zip.read('%s/%d/columns.json'%(name, iteration)))
+            if columns is not None:
+                names = [column for column in names if column in columns]
+            data = {}
+            for column in names:
+                with self.zip.open('%s/%d/%s.npy'%(name, iteration, column)) as f:
+                    data[column] = np.load(f, allow_pickle=False)
+            df = pd.DataFrame(data, columns=names)
+            df.insert(0, 'iteration', iteration)
+            dfs.append(df)
+        if not dfs:
+            return pd.DataFrame(columns=['iteration'])
+        return pd.concat(dfs, ignore_index=True)
+
+
+    def read_text(self, name, n):
+        """
+        Loads a text product (e.g. 'run_info') of the nth iteration.
+
+        """
+        return self.zip.read('%s/%d.txt'%(name, n)).decode()
+
+
+    def close(self):
+        """
+        Writes the bundle's central directory and closes the file.
+
+        """
+        if self.zip is not None:
+            self.zip.close()
+            self.zip = None
@@ -61,6 +61,24 @@ def main():
                             default=False, 
                             action='store_true',
     )
+    parser_run.add_argument('-c', '--converge', '--until-converged',
+                            dest='converge',
+                            help='Stop the MC iterations once the selection probabilities and mean priorities have converged (to within --tol), with --iter as the maximum number of iterations',
+                            default=False, 
+                            action='store_true',
+    )
+    parser_run.add_argument('--npz', '--bundle',
+                            dest='bundle',
+                            help='Save the data products of all MC iterations to a single (NPZ) bundle instead of per-iteration directories',
+                            default=False, 
+                            action='store_true',
+    )
+    parser_run.add_argument('--ess', '--compare',
+                            dest='ess',
+                            type=int,
+                            default=0,
+                            help="Instead of ranking, compare the effective sample size of the sampling schemes on this many replicates of --iter iterations (default=0, i.e. off)",
+    )
     parser_run.add_argument('--mc', '--iter', '--steps', 
                             dest='iter', 
                             help='Number of selection process iterations (default=1)',
@@ -83,7 +101,7 @@ def main():
                             dest='instrument',
                             type=str,
                             default='hires',
-                            help='What instrument to use for survey',
+                            help='Default instrument of the survey (e.g. for total times), where programs are costed on the instrument of their method (default=hires)',
     )
     parser_run.add_argument('--night', '--pool', '--nights',
                             dest='nights',
@@ -94,8 +112,27 @@ def main():
     parser_run.add_argument('--over', '--overhead',
                             dest='overhead',
                             type=float,
-                            default=2.0,
-                            help="Accounts for readout and slew times (minutes)",
+                            default=None,
+                            help="Accounts for readout and slew times (minutes, default is the instrument's, e.g. 2 for HIRES)",
+    )
+    parser_run.add_argument('-w', '--workers', '--procs',
+                            dest='workers',
+                            type=int,
+                            default=1,
+                            help="Number of processes to spread the MC iterations across (default=1)",
+    )
+    parser_run.add_argument('--sampling', '--scheme',
+                            dest='sampling',
+                            type=str,
+                            default='iid',
+                            choices=['iid', 'antithetic', 'sobol'],
+                            help="Random numbers of the program draws across MC iterations, i.e. independent, antithetic pairs or a scrambled Sobol' sequence (default='iid')",
+    )
+    parser_run.add_argument('--seed', '--root',
+                            dest='seed',
+                            type=int,
+                            default=2222,
+                            help="Root seed that the (independent) seed of every MC iteration is spawned from (default=2222)",
     )
     parser_run.add_argument('-s', '--save', 
                             dest='save',
@@ -103,17 +140,23 @@ def main():
                             default=True, 
                             action='store_false',
     )
+    parser_run.add_argument('--tol', '--tolerance',
+                            dest='tol',
+                            type=float,
+                            default=0.05,
+                            help="Tolerance on the standard errors of the selection probabilities and (relative) mean priorities of targets, used with --converge (default=0.05)",
+    )
     parser_run.add_argument('--tl', '--lower', '--tlower',
                             dest='time_lower',
                             type=float,
-                            default=3.0,
-                            help="Minimum exposure time allowed (minutes)",
+                            default=None,
+                            help="Minimum exposure time of template observations (minutes, default is the instrument's, e.g. 3 for HIRES)",
     )
     parser_run.add_argument('--tu', '--upper', '--tupper',
                             dest='time_upper',
                             type=float,
-                            default=20.0,
-                            help="Maximum exposure time allowed (minutes)",
+                            default=None,
+                            help="Maximum exposure time of template observations (minutes, default is the instrument's, e.g. 20 for HIRES)",
     )
 
     parser_run.set_defaults(func=pipeline.rank)
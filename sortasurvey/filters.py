@@ -0,0 +1,297 @@
+import ast
+import operator
+import numpy as np
+from collections import namedtuple
+
+
+Clause = namedtuple('Clause', ['op', 'children', 'value', 'columns', 'height'])
+
+
+def _notin(values, options):
+    return np.logical_not(np.isin(values, options))
+
+
+_COMPARE = {ast.Eq:operator.eq, ast.NotEq:operator.ne, ast.Lt:operator.lt, ast.LtE:operator.le,
+            ast.Gt:operator.gt, ast.GtE:operator.ge, ast.In:np.isin, ast.NotIn:_notin}
+_BINARY = {ast.Add:operator.add, ast.Sub:operator.sub, ast.Mult:operator.mul, ast.Div:operator.truediv,
+           ast.Pow:operator.pow, ast.Mod:operator.mod, ast.FloorDiv:operator.floordiv}
+_BOOLEAN = list(_COMPARE.values()) + [np.logical_and, np.logical_or, np.logical_not]
+_QUOTES = {'‘':"'", '’':"'", '“':'"', '”':'"'}
+
+
+class FilterCompiler:
+    """
+    Compiles the program filter expressions (i.e. the `filter` column in the survey
+    information) into boolean masks over the survey sample. Expressions use the same
+    syntax as `pandas.DataFrame.query` but are only parsed once. Every clause is stored
+    once, keyed by its parsed form, so clauses that are repeated across programs (e.g. the
+    standard vetting steps) are shared and only evaluated once. Masks are cached and
+    only recomputed when a column they depend on changes (see `update`).
+
+    Parameters
+    ----------
+    df : state.CandidateView
+        the sample to evaluate the filters on
+
+    Attributes
+    ----------
+    clauses : Dict[str,filters.Clause]
+        every (shared) clause in the compiled filters, keyed by its parsed form
+    filters : Dict[str,str]
+        maps the name of a filter (i.e. the program) to its root clause
+    cache : Dict[str,numpy.ndarray]
+        cached boolean masks for each evaluated clause
+    shared : Optional[shared.SharedSample]
+        shared memory that holds the static masks (see `share`)
+
+    """
+
+    def __init__(self, df):
+        self.df = df
+        self.clauses, self.filters, self.cache = {}, {}, {}
+        self.shared, self.shared_keys = None, {}
+
+
+    def __getstate__(self):
+        # the sample is rebound on every reset and shared masks are sent by reference
+        state = self.__dict__.copy()
+        state['df'] = None
+        state['cache'] = {key:mask for key, mask in self.cache.items() if key not in self.shared_keys}
+        return state
+
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        for key, name in self.shared_keys.items():
+            self.cache[key] = self.shared.get(name)
+
+
+    def compile(self, name, expression):
+        """
+        Parses a filter expression and stores it under the given name. Empty (or missing)
+        expressions select the whole sample and curly quotes are replaced by straight ones.
+
+        Parameters
+        ----------
+        name : str
+            name of the filter (i.e. the program)
+        expression : str
+            the filter expression, e.g. "photo_vetting == 'passed' and rp < 4."
+
+        Returns
+        -------
+        key : str
+            the root clause of the compiled filter
+
+        """
+        if not isinstance(expression, str) or not expression.strip():
+            expression = 'True'
+        for quote, replace in _QUOTES.items():
+            expression = expression.replace(quote, replace)
+        try:
+            tree = ast.parse(expression.strip(), mode='eval')
+        except SyntaxError as error:
+            raise ValueError("invalid filter for %s: %s"%(name, expression)) from error
+        self.filters[name] = self.add_clause(tree.body)
+        return self.filters[name]
+
+
+    def add_clause(self, node):
+        """
+        Recursively converts a parsed expression into (shared) clauses.
+
+        """
+        try:
+            value = ast.literal_eval(node)
+        except ValueError:
+            pass
+        else:
+            if isinstance(value, (list, tuple, set)):
+                value = list(value)
+            return self.get_clause(None, [], value, set())
+        if isinstance(node, ast.Name):
+            return self.get_clause(None, [], node.id, {node.id})
+        if isinstance(node, ast.BoolOp):
+            op = np.logical_and if isinstance(node.op, ast.And) else np.logical_or
+            children = []
+            for child in node.values:
+                # flatten nested clauses of the same kind, i.e. (a and b) and c
+                if isinstance(child, ast.BoolOp) and type(child.op) is type(node.op):
+                    children += self.clauses[self.add_clause(child)].children
+                else:
+                    children.append(self.add_clause(child))
+            return self.get_clause(op, children)
+        if isinstance(node, ast.Compare):
+            # chained comparisons (e.g. 1 < rp < 4) are split into pairs
+            children, left = [], node.left
+            for op, right in zip(node.ops, node.comparators):
+                if type(op) not in _COMPARE:
+                    raise ValueError("unsupported comparison in filter: %s"%type(op).__name__)
+                children.append(self.get_clause(_COMPARE[type(op)], [self.add_clause(left), self.add_clause(right)]))
+                left = right
+            if len(children) == 1:
+                return children[0]
+            return self.get_clause(np.logical_and, children)
+        if isinstance(node, ast.UnaryOp):
+            if isinstance(node.op, ast.Not):
+                return self.get_clause(np.logical_not, [self.add_clause(node.operand)])
+            if isinstance(node.op, ast.USub):
+                return self.get_clause(operator.neg, [self.add_clause(node.operand)])
+        if isinstance(node, ast.BinOp) and type(node.op) in _BINARY:
+            return self.get_clause(_BINARY[type(node.op)], [self.add_clause(node.left), self.add_clause(node.right)])
+        raise ValueError("unsupported expression in filter: %s"%ast.dump(node))
+
+
+    def get_clause(self, op, children, value=None, columns=None):
+        """
+        Returns the key of a clause, adding it to the compiler if it does not exist yet.
+
+        """
+        if op is None:
+            key = repr(('column' if columns else 'value', value))
+        else:
+            key = repr((getattr(op, '__name__', repr(op)), tuple(children)))
+        if key not in self.clauses:
+            if op is not None:
+                columns, height = set(), 0
+                for child in children:
+                    columns |= self.clauses[child].columns
+                    height = max(height, self.clauses[child].height+1)
+            else:
+                height = 0
+            self.clauses[key] = Clause(op, list(children), value, frozenset(columns), height)
+        return key
+
+
+    def mask(self, name, rows=None):
+        """
+        Boolean mask of the sample for the given filter.
+
+        Parameters
+        ----------
+        name : str
+            name of the filter (i.e. the program)
+        rows : Optional[numpy.ndarray]
+            only return the mask for these rows (default is all rows)
+
+        Returns
+        -------
+        mask : numpy.ndarray
+            `True` for rows that pass the filter
+
+        """
+        # only the requested rows are evaluated (or read from the cache), so that
+        # checking a few rows does not scale with the size of the sample
+        values = np.asarray(self.evaluate(self.filters[name], rows))
+        if rows is not None:
+            return np.broadcast_to(values, (len(rows),)).astype(bool)
+        return np.broadcast_to(values, (len(self.df),)).astype(bool)
+
+
+    def columns(self, name):
+        """
+        The set of columns a given filter depends on.
+
+        """
+        return set(self.clauses[self.filters[name]].columns)
+
+
+    def evaluate(self, key, rows=None):
+        """
+        Evaluates a clause, using (and filling) the cache of boolean masks.
+
+        """
+        if key in self.cache:
+            return self.cache[key] if rows is None else self.cache[key][rows]
+        values = self.compute(key, rows)
+        clause = self.clauses[key]
+        if rows is None and any(clause.op is op for op in _BOOLEAN):
+            values = np.broadcast_to(np.asarray(values), (len(self.df),)).astype(bool)
+            self.cache[key] = values.copy()
+        return values
+
+
+    def compute(self, key, rows=None):
+        """
+        Evaluates a clause from its children, ignoring its own cached mask.
+
+        """
+        clause = self.clauses[key]
+        if clause.op is None:
+            if not clause.columns:
+                return clause.value
+            if clause.value not in self.df.columns:
+                raise KeyError("filter column '%s' not in the sample"%clause.value)
+            return self.df.get(clause.value, rows)
+        children = [self.evaluate(child, rows) for child in clause.children]
+        if clause.op in (np.logical_and, np.logical_or):
+            values = children[0]
+            for child in children[1:]:
+                values = clause.op(values, child)
+            return values
+        return clause.op(*children)
+
+
+    def update(self, df, columns=None, rows=None):
+        """
+        Rebinds the compiler to the (updated) sample and recomputes the cached masks
+        that depend on the changed columns. If rows are provided, only those rows are
+        recomputed, otherwise the affected masks are dropped and lazily recomputed.
+
+        Parameters
+        ----------
+        df : state.CandidateView
+            the updated sample (must have the same rows)
+        columns : Optional[List[str]]
+            columns that changed (default is all columns)
+        rows : Optional[numpy.ndarray]
+            rows that changed (default is all rows)
+
+        """
+        self.df = df
+        if columns is not None:
+            columns = set(columns)
+        stale = [key for key in self.cache if columns is None or self.clauses[key].columns & columns]
+        if rows is None:
+            for key in stale:
+                del self.cache[key]
+        else:
+            rows = np.asarray(rows)
+            # children are updated before their parents
+            for key in sorted(stale, key=lambda key: self.clauses[key].height):
+                self.cache[key][rows] = np.broadcast_to(np.asarray(self.compute(key, rows)), (len(rows),)).astype(bool)
+
+
+    def share(self, shared, columns):
+        """
+        Moves the cached masks that do not depend on the given columns (i.e. the ones
+        that never change during the selection process) into shared memory, so that
+        MC worker processes do not need to copy (or recompute) them.
+
+        Parameters
+        ----------
+        shared : shared.SharedSample
+            the shared memory to store the masks in
+        columns : List[str]
+            columns that change during the selection process
+
+        """
+        columns = set(columns)
+        for key in list(self.cache):
+            if self.clauses[key].columns & columns:
+                del self.cache[key]
+            elif key not in self.shared_keys:
+                name = 'mask_%d'%len(self.shared_keys)
+                shared.put(name, self.cache[key])
+                self.cache[key], self.shared_keys[key] = shared.get(name), name
+        self.shared = shared
+
+
+    def unshare(self):
+        """
+        Copies the shared masks back into (private) memory, i.e. before the shared memory is freed.
+
+        """
+        for key in self.shared_keys:
+            self.cache[key] = self.cache[key].copy()
+        self.shared, self.shared_keys = None, {}
@@ -0,0 +1,54 @@
+import numpy as np
+
+
+
+
+class TargetIndex:
+    """
+    Hash index of the survey sample, which maps a TIC to all of its rows (i.e. planets)
+    and a TOI to its row. TOIs are stored as integer codes (see `toi_code`) so lookups
+    do not depend on float formatting.
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        the survey sample with a default (i.e. positional) index
+
+    Attributes
+    ----------
+    tics : Dict[int,List[int]]
+        maps each TIC to its rows in the sample
+    tois : Dict[int,int]
+        maps each TOI code to its row in the sample
+
+    """
+
+    def __init__(self, df):
+        self.tics, self.tois = {}, {}
+        for row, (tic, toi) in enumerate(zip(df['tic'].values.tolist(), df['toi'].values.tolist())):
+            self.tics.setdefault(int(tic), []).append(row)
+            self.tois[toi_code(toi)] = row
+
+
+    def get_rows(self, tic):
+        """
+        Returns all rows of the sample for a given TIC (empty if the TIC is not in the sample).
+
+        """
+        return list(self.tics.get(int(tic), []))
+
+
+    def get_row(self, toi):
+        """
+        Returns the row of the sample for a given TOI (`None` if the TOI is not in the sample).
+
+        """
+        return self.tois.get(toi_code(toi))
+
+
+def toi_code(toi):
+    """
+    Integer code of a TOI, i.e. 1469.01 -> 146901.
+
+    """
+    return int(np.round(float(toi)*100.))
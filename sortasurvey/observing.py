@@ -1,209 +1,523 @@
+import os
 import numpy as np
 import pandas as pd
+from functools import lru_cache
+from collections import namedtuple
 from scipy.optimize import brentq
+from scipy.interpolate import InterpolatedUnivariateSpline, RegularGridInterpolator
+
+from sortasurvey.tables import LookupTable, get_table, tabulate
 pd.set_option('mode.chained_assignment', None)
+try:
+    from astropy.io import fits
+except ImportError:
+    fits = None
 
 
 
 
 class Instrument:
-
-    def __init__(self, survey):
+    """
+    Cost engine for a given survey instrument. The scalar interface (i.e. calling
+    the class) and the batch interface (via `cost_function`) share the same code
+    path, so both return identical remaining times. The exposure time calculator of
+    the instrument is looked up in the instrument registry (see `get_instrument`) and
+    the survey's exposure time limits and overhead default to the instrument's. The
+    cost engine does not change after it is initialized, so it is thread- and process-safe.
+
+    Parameters
+    ----------
+    survey : survey.Survey
+        survey object containing the observing/instrument information (via survey.params)
+    name : Optional[str]
+        name of the instrument (default is the survey's instrument, via args.instrument)
+
+    Attributes
+    ----------
+    name : str
+        name of the instrument, i.e. any registered instrument (e.g. ['hires', 'apf', 'kpf'])
+    inst : observing.Spectrograph
+        the instrument-specific exposure time calculator
+    time_lower, time_upper : float
+        minimum and maximum exposure time (in seconds) of template observations
+    overhead : float
+        readout and slew time (in seconds) of every observation
+
+    """
+
+    def __init__(self, survey, name=None):
         # General survey information
-        self.name = survey.instrument
+        self.name = survey.params['instrument'] if name is None else name
+        # Initialize specific instrument (+ exposure time calculator)
+        self.inst = get_instrument(self.name)()
         # General survey observing/instrument information
-        self.archival, self.overhead = survey.params['archival'], survey.params['overhead']
-        self.time_lower, self.time_upper = survey.params['time_lower'], survey.params['time_upper']
+        self.archival = survey.params['archival']
+        limits = []
+        for limit in ['time_lower', 'time_upper', 'overhead']:
+            limits.append(getattr(self.inst, limit) if survey.params[limit] is None else survey.params[limit])
+        self.time_lower, self.time_upper, self.overhead = limits
 
     def __call__(self, teff, vmag, method, template=False, nobs=0):
-        self.teff = teff
-        self.vmag = vmag
-        self.template = template
-        self.nobs = nobs
-        # Specific observing method (which can vary depending on science case)
-        self.counts = method.split('=')[-1]
-        self.nobs_goal = int(float((method.split('-')[1]).split('=')[-1]))
-        if self.counts == 'ramp':
-            self.counts = self.exp_ramp()
-        else:
-            self.counts = float(self.counts)
-        # Initialize specific instrument (+ cost function)
-        # Available instruments
-        instruments={'hires':HIRES,'apf':APF,'kpf',KPF}
-        inst = instruments[self.name]
-        inst.cost_function()
-        return inst.rem_time
-
-    def cost_function(self):
+        rem_time = self.cost_function([teff], [vmag], method, template=[template], nobs=[nobs])
+        return float(rem_time[0])
+
+    def cost_function(self, teff, vmag, method, template=None, nobs=None, archival=None, template_counts=250.):
         """
-        Estimates the total amount of time needed on sky for a given target, which 
+        Estimates the total amount of time needed on sky for an array of targets, which
         is highly dependent on the instrument using to collect the data
 
         Parameters
         ----------
-        df : pandas.DataFrame
-            dataframe containing a target's vmag and other required information in the cost function
-        method : str
-            observing method of a particular program
-    
+        teff : numpy.ndarray
+            target effective temperatures
+        vmag : numpy.ndarray
+            target V magnitudes
+        method : Union[str,observing.MethodSpec]
+            observing method of a particular program (see `parse_method`), which must be on this
+            instrument (see `Survey.get_instrument` for the cost engine of any method)
+        template : Optional[numpy.ndarray]
+            `True` if a template has already been acquired for the target (default is all `False`)
+        nobs : Optional[numpy.ndarray]
+            number of archival observations for each target (default is all `0`)
+        archival : Optional[bool]
+            include archival data in the total time estimates (default is the survey's `archival` option)
+        template_counts : float
+            exposure counts needed for the (iodine-out) template observation
+
         Returns
         -------
-        rem_time : float
+        rem_time : numpy.ndarray
             the remaining time (in seconds) needed to achieve your specified science.
 
+        Raises
+        ------
+        ValueError
+            if the observing method is on a different instrument
+
         """
+        # Specific observing method (which can vary depending on science case)
+        spec = parse_method(method)
+        if spec.instrument != self.name.lower():
+            raise ValueError("observing method '%s' is not on %s"%(method, self.name))
+        teff = np.atleast_1d(np.asarray(teff, dtype=float))
+        vmag = np.atleast_1d(np.asarray(vmag, dtype=float))
+        if template is None:
+            template = np.zeros(len(vmag), dtype=bool)
+        template = np.atleast_1d(np.asarray(template)).astype(bool)
+        if nobs is None:
+            nobs = np.zeros(len(vmag))
+        nobs = np.nan_to_num(np.atleast_1d(np.asarray(nobs, dtype=float)))
+        nobs_goal = spec.nobs
+        if spec.ramp:
+            counts = self.inst.exp_ramp(vmag)
+        else:
+            counts = np.full(len(vmag), spec.counts)
         # estimate how much time a target would take, given a program's observing method
-        self.exposure_time()
-        # make a cut at a survey's maximum allowable exposure time per observation
-#        exp = np.clip(exp, self.time_lower, self.time_upper)
+        exp_time = self.inst.exposure_time(teff, vmag, counts, iodine=spec.iodine)
+        # science exposures are not clipped, i.e. time_lower and time_upper only apply to templates
         # include archival data in total time estimates
-        if self.archival:
-            self.rem_nobs = int(self.nobs_goal-self.nobs)
-            if self.rem_nobs < 0:
-                self.rem_nobs = 0
-                self.rem_time = 0.
+        if archival is None:
+            archival = self.archival
+        if archival:
+            rem_nobs = np.clip(np.trunc(nobs_goal-nobs), 0, None)
         else:
-            self.rem_nobs = self.nobs_goal
-        self.rem_time = self.exp_time*self.rem_nobs+self.overhead*self.rem_nobs
+            rem_nobs = np.full(len(vmag), float(nobs_goal))
+        rem_time = exp_time*rem_nobs+self.overhead*rem_nobs
         # if a template has not been acquired for a target yet
-        if not self.template:
-            self.counts = 250.
-            self.exposure_time(iodine=False)
+        if not np.all(template):
+            mask = ~template
+            exp = self.inst.exposure_time(teff[mask], vmag[mask], np.full(np.sum(mask), template_counts), iodine=False)
             exp = np.clip(exp, self.time_lower, self.time_upper)
-            self.rem_time += (self.exp_time+self.overhead)
+            rem_time[mask] += (exp+self.overhead)
+        return rem_time
+
+
+class MethodSpec(namedtuple('MethodSpec', ['instrument', 'nobs', 'counts', 'iodine'])):
+    """
+    Parsed observing method of a program (e.g. 'hires-nobs=60-counts=ramp'), which is
+    immutable and hashable (e.g. a key of cost caches, see `Survey.cost_matrix`).
+
+    Attributes
+    ----------
+    instrument : str
+        name of the (registered) instrument
+    nobs : int
+        number of observations needed per target (i.e. the nobs goal)
+    counts : Union[str,float]
+        exposure counts per observation, or 'ramp' for counts that ramp with the V magnitude
+    iodine : bool
+        `True` if the iodine cell is in the light path (default is `True`)
+
+    """
+
+    __slots__ = ()
+
+    def __str__(self):
+        method = '%s-nobs=%d-counts=%s'%(self.instrument, self.nobs, self.counts if self.ramp else '%g'%self.counts)
+        if not self.iodine:
+            method += '-iodine=False'
+        return method
+
+    @property
+    def ramp(self):
+        return self.counts == 'ramp'
+
+
+def parse_method(method):
+    """
+    Parses (and validates) an observing method, i.e. '<instrument>-nobs=<int>-counts=<float|ramp>' 
+    with an optional '-iodine=<True|False>'. Every method string is only parsed once and the same
+    (interned) spec is returned for every following call.
+
+    Parameters
+    ----------
+    method : Union[str,observing.MethodSpec]
+        the observing method
+
+    Returns
+    -------
+    spec : observing.MethodSpec
+        the parsed observing method
+
+    """
+    if isinstance(method, MethodSpec):
+        return method
+    return _parse_method(str(method).strip())
+
+
+@lru_cache(maxsize=None)
+def _parse_method(method):
+    tokens = method.split('-')
+    options = {}
+    for token in tokens[1:]:
+        key, sep, value = token.partition('=')
+        if not sep or key.strip().lower() not in ['nobs', 'counts', 'iodine']:
+            raise ValueError("invalid token '%s' in observing method '%s'"%(token, method))
+        options[key.strip().lower()] = value.strip()
+    if 'nobs' not in options or 'counts' not in options:
+        raise ValueError("observing method '%s' needs both 'nobs' and 'counts'"%method)
+    instrument = tokens[0].strip().lower()
+    get_instrument(instrument)
+    try:
+        nobs = int(float(options['nobs']))
+        counts = 'ramp' if options['counts'].lower() == 'ramp' else float(options['counts'])
+    except ValueError:
+        raise ValueError("invalid nobs or counts in observing method '%s'"%method)
+    if nobs < 0 or (counts != 'ramp' and not counts > 0.):
+        raise ValueError("invalid nobs or counts in observing method '%s'"%method)
+    iodine = options.get('iodine', 'true').lower()
+    if iodine not in ['true', 'false']:
+        raise ValueError("invalid iodine option in observing method '%s'"%method)
+    return MethodSpec(instrument, nobs, counts, iodine == 'true')
+
+
+INSTRUMENTS = {}
+
+def register(name, instrument=None):
+    """
+    Registers an exposure time calculator (i.e. a `Spectrograph` subclass) under a
+    name, which can be used as a class decorator (i.e. `@register('name')`). Third-party
+    instruments can also be registered through the 'sortasurvey.instruments' entry point
+    group of their package (see `get_instrument`).
+
+    Parameters
+    ----------
+    name : str
+        name of the instrument (case insensitive), as used by args.instrument and program methods
+    instrument : Optional[type]
+        the exposure time calculator (default is `None`, i.e. returns a decorator)
+
+    """
+    def decorator(instrument):
+        INSTRUMENTS[name.lower()] = instrument
+        return instrument
+    if instrument is None:
+        return decorator
+    return decorator(instrument)
+
+
+def get_instrument(name, group='sortasurvey.instruments'):
+    """
+    Looks up a registered instrument, where instruments of other packages are loaded
+    from their entry points the first time an unknown instrument is requested.
+
+    Parameters
+    ----------
+    name : str
+        name of the instrument (case insensitive)
+    group : str
+        entry point group of third-party instruments (default is 'sortasurvey.instruments')
+
+    Returns
+    -------
+    instrument : type
+        the exposure time calculator (i.e. a `Spectrograph` subclass)
+
+    """
+    if name.lower() not in INSTRUMENTS:
+        try:
+            from importlib.metadata import entry_points
+        except ImportError:
+            entry_points = None
+        if entry_points is not None:
+            points = entry_points()
+            points = points.select(group=group) if hasattr(points, 'select') else points.get(group, [])
+            for point in points:
+                if point.name.lower() not in INSTRUMENTS:
+                    register(point.name, point.load())
+    if name.lower() not in INSTRUMENTS:
+        raise ValueError("unknown instrument '%s' (options are %s)"%(name, sorted(INSTRUMENTS)))
+    return INSTRUMENTS[name.lower()]
+
+
+class Spectrograph:
+    """
+    Base class of the exposure time calculators of instruments (see `register`). An 
+    instrument implements `exposure_time(teff, vmag, counts, iodine=False)` and
+    `counts_to_err(counts)` for whole arrays of targets and can declare its own exposure 
+    time limits and overhead (in seconds), which are used unless the survey sets them. 
+    The exposure time limits only clip the (iodine-out) template observation of a target,
+    i.e. science exposures are never clipped (see `Instrument.cost_function`).
+    Exposure time calculators must not keep any per-call state (i.e. only configuration
+    that is set when initialized), so that they are thread- and process-safe.
+
+    Attributes
+    ----------
+    name : str
+        name of the instrument
+    time_lower, time_upper : float
+        minimum and maximum exposure time of template observations (default is 3 and 20 minutes)
+    overhead : float
+        readout and slew time of every observation (default is 2 minutes)
+    ramp_counts : Tuple[float,float]
+        counts of bright and faint targets of the exposure ramp (i.e. 'counts=ramp', see `exp_ramp`),
+        in the units of the instrument's counts (default is 250k and 60k, i.e. HIRES)
+
+    """
+
+    name = None
+    time_lower, time_upper, overhead = 180., 1200., 120.
+    ramp_counts = (250., 60.)
+
+    def exposure_time(self, teff, vmag, counts, iodine=False):
+        raise NotImplementedError("%s does not implement exposure_time"%type(self).__name__)
+
+
+    def counts_to_err(self, counts):
+        raise NotImplementedError("%s does not implement counts_to_err"%type(self).__name__)
+
+
+    def exp_ramp(self, vmag, vmag_1=10.5, vmag_2=12.0, counts_1=None, counts_2=None):
+        """
+        Calculates exposure counts based on a minimum (v1) and maximum (v2)
+        magnitude limits, with a linear ramp between the two magnitude limits.
 
+        Parameters
+        ----------
+        vmag : numpy.ndarray
+            target magnitudes
+        vmag_1 : float
+            below this mag targets get full counts (c1)
+        vmag_2 : float
+            fainter than this mag targets get c2
+        counts_1 : Optional[float]
+            expcounts for bright targets (default is ramp_counts[0], e.g. 250k for HIRES)
+        counts_2 : Optional[float]
+            expcounts for the faint limit (default is ramp_counts[1], e.g. 60k for HIRES)
 
-class HIRES(Instrument):
+        Returns
+        -------
+        counts : numpy.ndarray
+            expected number of photon counts (in the instrument's units, e.g. x1000 for HIRES)
 
-    def __init__(self):
-        # General instrument information
+        """
+        if counts_1 is None:
+            counts_1 = self.ramp_counts[0]
+        if counts_2 is None:
+            counts_2 = self.ramp_counts[1]
+        vmag = np.asarray(vmag, dtype=float)
+        exp_level = np.interp(vmag, xp=[vmag_1, vmag_2], fp=[np.log10(counts_1), np.log10(counts_2)])
+        counts = 10.**exp_level
+        counts = np.where(vmag <= vmag_1, counts_1, counts)
+        counts = np.where(vmag >= vmag_2, counts_2, counts)
+        return counts
 
-    def exposure_time(self, iodine=False, vmag_0=8., time_0=110., counts_0=250., iodine_factor=0.7):
+
+@register('hires')
+class HIRES(Spectrograph):
+
+    name = 'hires'
+
+    def exposure_time(self, teff, vmag, counts, iodine=False, vmag_0=8., time_0=110., counts_0=250., iodine_factor=0.7):
         """
         Expected exposure time based on the scaling from a canonical exposure time
         of 110s to get to 250k on 8th mag star with the iodine cell in the light
         path
-    
+
         Parameters
         ----------
-        expcounts : float 
-            desired number of counts 
+        teff : numpy.ndarray
+            target effective temperatures (unused for HIRES)
+        vmag : numpy.ndarray
+            target V magnitudes
+        counts : numpy.ndarray
+            desired number of counts
             250 = 250k, 10 = 10k (CKS) i.e. SNR = 45 per pixel.
         iodine (bool) : is iodine cell in or out? If out, throughput is higher by 30%
-    
+
         Returns
         -------
-        exptime : float
+        exp_time : numpy.ndarray
             exposure time [seconds]
-    
+
         """
         # flux star / flux 8th mag star
-        fluxfactor = 10.0**(-0.4*(self.vmag-vmag_0)) 
-        self.exp_time = time_0/fluxfactor 
-        self.exp_time *= self.counts/counts_0
+        fluxfactor = 10.0**(-0.4*(np.asarray(vmag, dtype=float)-vmag_0))
+        exp_time = time_0/fluxfactor
+        exp_time *= np.asarray(counts, dtype=float)/counts_0
         if not iodine:
-            self.exp_time *= iodine_factor
+            exp_time *= iodine_factor
+        return exp_time
 
 
-    def exp_ramp(self, vmag_1=10.5, vmag_2=12.0, counts_1=250., counts_2=60.):
-        """
-        Calculates exposure counts based on a minimum (v1) and maximum (v2)
-        magnitude limits, with a linear ramp between the two magnitude limits.
-
-        Parameters
-        ----------
-        vmag : float 
-            target magnitude
-        vmag_1 : float 
-            below this mag targets get full counts (c1)
-        vmag_2 : float
-            fainter than this mag targets get c2
-        counts_1 : float
-            expcounts (k) for bright targets
-        counts_2 : float
-            expcounts (k) for the faint limit
-
-        Returns
-        -------
-        counts : float
-            expected number of photon counts (x1000)
-
-        """
-        if self.vmag <= vmag_1:
-            return counts_1
-        if self.vmag >= vmag_2:
-            return counts_2
-        exp_level = np.interp(vmag, xp=[vmag_1, vmag_2], fp=[np.log10(counts_1), np.log10(counts_2)])
-        self.counts = 10.**exp_level
-
-
-    def counts_to_err_hires(self):
+    def counts_to_err(self, counts):
         '''
         Compute the expected RV error for an iodine-in observation, scaling from 2.5 m/s at 250k counts
 
         '''
-        self.err = 2.0/np.sqrt(self.counts/60.0)
+        return 2.0/np.sqrt(np.asarray(counts, dtype=float)/60.0)
+
+    counts_to_err_hires = counts_to_err
 
 
 
-class APF(Instrument):
+@register('apf')
+class APF(Spectrograph):
 
-    def __init__(self):
-        # General instrument information
+    name = 'apf'
+    # exposure meter counts (in G) with the same expected RV error as the HIRES ramp (see `counts_to_err`)
+    ramp_counts = (2.8125, 0.675)
 
-    def exposure_time(self, vmag_0=22.9, time_0=1e9, iodine_factor=0.7, decker='M',
+    def exposure_time(self, teff, vmag, counts, iodine=False, vmag_0=22.9, time_0=1e9, iodine_factor=0.7, decker='M',
                       scale={'M':1.0,'W':1.0,'N':3.0,'B':0.5,'S':2.0,'L':0.5},):
         """
         Calculate expected exposure time for an APF observation
 
         Parameters
         ----------
-        vmag : float
-            V-band magnitude 
-        counts : float
+        teff : numpy.ndarray
+            target effective temperatures (unused for APF)
+        vmag : numpy.ndarray
+            V-band magnitude
+        counts : numpy.ndarray
             Desired exposure meter counts (i.e. 1.0 = 1.0G, SNR~155/pix)
-        decker : str, Optional 
+        decker : str, Optional
             The decker for observation, default is `M`.
 
         Returns
         -------
-        exp_time : float
+        exp_time : numpy.ndarray
             exposure time in seconds
 
         """
-        fluxfactor = 10.0**(-0.4*(self.vmag-vmag_0))
-        self.exp_time = (self.counts*time_0)/fluxfactor
+        fluxfactor = 10.0**(-0.4*(np.asarray(vmag, dtype=float)-vmag_0))
+        exp_time = (np.asarray(counts, dtype=float)*time_0)/fluxfactor
         if decker in scale:
-            self.exp_time *= scale[decker]
+            exp_time *= scale[decker]
         if not iodine:
-            self.exp_time *= iodine_factor
+            exp_time *= iodine_factor
+        return exp_time
 
 
-    def counts_to_err_apf(self):
+    def counts_to_err(self, counts):
         """
         Compute the expected RV error for an iodine-in observation, scaling from 2.5 m/s at 250k counts
 
         """
-        self.err = 3.0/np.sqrt(self.counts/0.3)
+        return 3.0/np.sqrt(np.asarray(counts, dtype=float)/0.3)
 
+    counts_to_err_apf = counts_to_err
 
-class KPF(Instrument):
 
-    def __init__(self):
-        # General instrument information
+@register('kpf')
+class KPF(Spectrograph):
 
-    def exposure_time(self, wavelength=550.0, ind=2, minout=0.):
+    name = 'kpf'
+
+    def __init__(self, path=None, wavelength=550.0, table=True):
+        # photon grids (and lookup table) of the exposure time calculator
+        self.path, self.wavelength, self.table = path, wavelength, table
+
+    def exposure_time(self, teff, vmag, snr, iodine=False):
+        """
+        Estimates the exposure times required to reach a specified signal-to-noise
+        value (snr) for an array of stellar targets. KPF does not use an iodine
+        cell, so the `iodine` keyword is ignored. By default, exposure times are
+        interpolated from a precomputed (memory-mapped) lookup table (see `get_kpf_table`)
+        and only targets outside of the table use the photon grids, which are read (and 
+        their interpolators built) once per process (see `get_kpf_grid`).
+
+        Parameters
+        ----------
+        teff : numpy.ndarray
+            Target effective temperatures
+        vmag : numpy.ndarray
+            Target V magnitudes
+        snr : numpy.ndarray
+            Desired spectral SNR
+
+        Returns
+        -------
+        exp_time : numpy.ndarray
+            Estimated exposure times for reaching specified snr
+
+        """
+        if not self.table:
+            return get_kpf_grid(path=self.path, wavelength=self.wavelength).exposure_time(teff, vmag, snr)
+        teff, vmag, snr = np.broadcast_arrays(np.atleast_1d(np.asarray(teff, dtype=float)), 
+                                              np.atleast_1d(np.asarray(vmag, dtype=float)), 
+                                              np.atleast_1d(np.asarray(snr, dtype=float)))
+        table = get_kpf_table(path=self.path, wavelength=self.wavelength)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            exp_time = 10.**table(teff, vmag, np.log10(snr))
+        # whole seconds above the shortest exposure time of the grid (see `KPFGrid.exposure_time`)
+        time_0 = table.info['time_0']
+        exp_time = time_0 + np.maximum(np.ceil(exp_time-time_0-1e-9), 2.)
+        outside = np.isnan(exp_time)
+        if np.any(outside):
+            exp_time[outside] = get_kpf_grid(path=self.path, wavelength=self.wavelength).exposure_time(teff[outside], vmag[outside], snr[outside])
+        return exp_time
+
+
+    def counts_to_err(self, snr, snr_0=150., err_0=0.5):
+        """
+        Compute the expected (photon-limited) RV error of a KPF observation, scaling from
+        0.5 m/s at a spectral SNR of 150. The SNR grows with the square root of the counts,
+        so the error scales as 1/SNR (i.e. the same scaling as `HIRES.counts_to_err`).
+
+        Parameters
+        ----------
+        snr : numpy.ndarray
+            spectral SNR (at the wavelength of the exposure time calculator)
+
+        Returns
+        -------
+        err : numpy.ndarray
+            expected RV error [m/s]
+
+        """
+        return err_0*snr_0/np.asarray(snr, dtype=float)
+
+    counts_to_err_kpf = counts_to_err
+
+
+    def target_exposure_time(self, teff, vmag, snr, wavelength=550.0, ind=2):
         """
         Estimates the exposure time required to reach a specified signal-to-noise
         value (snr) at a specified wavelength for a given stellar target. The
         target is defined by the stellar effective temperature (teff) and V
         magnitude (vmag)
 
-        This function interpolates over a pre-computed grid of RV uncertainty values
-        to estimate the optimum exposure length. This is done by looping through
-        'trial' exposure time guesses to see which yields sigma_rv closest to the
-        desired value.
-
         Parameters
         ----------
         teff : :obj:`float`
@@ -214,6 +528,8 @@ class KPF(Instrument):
             Desired spectral SNR
         wavelength : :obj:'float'
             Wavelength of desired SNR
+        ind : :obj:`int`
+            Shortest trial exposure time (in seconds) above the shortest exposure time of the grid
 
         Returns
         -------
@@ -221,41 +537,242 @@ class KPF(Instrument):
             Estimated exposure time for reaching specified snr
 
         """
-        # Grid files for teff, vmag, exp_time
-        teff_grid_file = os.path.join(os.path.abspath(os.getcwd()), 'info', 'photon_grid_teff.fits')
-        vmag_grid_file = os.path.join(os.path.abspath(os.getcwd()), 'info', 'photon_grid_vmag.fits')
-        exp_time_grid_file = os.path.join(os.path.abspath(os.getcwd()), 'info', 'photon_grid_exptime.fits')
-        wvl_ord_file = os.path.join(os.path.abspath(os.getcwd()), 'info', 'order_wvl_centers.fits')
-        # Master grid files for interpolation
-        snr_grid_file = os.path.join(os.path.abspath(os.getcwd()), 'info', 'snr_master_order.fits')
-        snr_grid_all = fits.getdata(snr_grid_file)    
+        grid = get_kpf_grid(path=self.path, wavelength=wavelength)
+        return float(grid.exposure_time([teff], [vmag], [snr], step=ind)[0])
+
+
+class KPFGrid:
+    """
+    Pre-computed KPF grid of the spectral SNR over (exposure time, V magnitude, effective 
+    temperature), with its interpolators built once. Exposure times are found by inverting
+    the SNR grid for whole arrays of targets at once: the SNR is linear in the (fractional) 
+    exposure time index between grid nodes, so the index that reaches the desired SNR is
+    found by monotone table inversion, which is then mapped back to an exposure time by 
+    bracketing (i.e. bisection). As before, exposure times are whole seconds above the 
+    shortest exposure time of the grid, i.e. the first trial exposure time (in steps of 
+    1 second) that reaches the desired SNR.
+
+    Parameters
+    ----------
+    teff : numpy.ndarray
+        effective temperatures of the grid
+    vmag : numpy.ndarray
+        V magnitudes of the grid
+    exptime : numpy.ndarray
+        exposure times of the grid (in seconds)
+    snr : numpy.ndarray
+        exposure time x V magnitude x effective temperature grid of the SNR (at a given wavelength)
+
+    """
+
+    def __init__(self, teff, vmag, exptime, snr):
+        self.teff, self.vmag = np.asarray(teff, dtype=float), np.asarray(vmag, dtype=float)
+        self.exptime, self.snr_grid = np.asarray(exptime, dtype=float), np.asarray(snr, dtype=float)
+        self.logexp = np.log10(self.exptime)
+        # fractional indices for the relevant input parameters
+        self.teff_index = InterpolatedUnivariateSpline(self.teff, np.arange(len(self.teff), dtype=np.double))
+        self.vmag_index = InterpolatedUnivariateSpline(self.vmag, np.arange(len(self.vmag), dtype=np.double))
+        self.exptime_index = InterpolatedUnivariateSpline(self.logexp, np.arange(len(self.exptime), dtype=np.double))
+        self.interpolator = RegularGridInterpolator((np.arange(len(self.exptime)), np.arange(len(self.vmag)), 
+                                                     np.arange(len(self.teff))), self.snr_grid)
+
+
+    def locate(self, teff, vmag):
+        """
+        Fractional grid indices of targets, where (spline) rounding errors at the edges of the grid are removed.
+
+        """
+        locations = []
+        for spline, n, values in [(self.teff_index, len(self.teff), teff), (self.vmag_index, len(self.vmag), vmag)]:
+            location = spline(values)
+            edge = np.clip(location, 0., n-1.)
+            locations.append(np.where(np.abs(location-edge) < 1e-6, edge, location))
+        return locations
+
+
+    def get_snr(self, teff_location, vmag_location, exp_time):
+        """
+        Expected SNR of targets (at their fractional grid locations) for the given exposure times.
+
+        """
+        exptime_location = self.exptime_index(np.log10(exp_time))
+        return self.interpolator(np.stack([exptime_location, vmag_location, teff_location], axis=-1))
+
+
+    def invert(self, teff, vmag, snr):
+        """
+        Estimates the (continuous) exposure times at which the interpolated SNR of an array 
+        of stellar targets reaches a specified signal-to-noise value (snr). 
+
+        Parameters
+        ----------
+        teff : numpy.ndarray
+            target effective temperatures
+        vmag : numpy.ndarray
+            target V magnitudes
+        snr : numpy.ndarray
+            desired spectral SNR
+
+        Returns
+        -------
+        exp_time : numpy.ndarray
+            exposure times (in seconds), which are `nan` if the desired snr is beyond the grid
+
+        """
+        teff, vmag, snr = np.broadcast_arrays(np.atleast_1d(np.asarray(teff, dtype=float)), 
+                                              np.atleast_1d(np.asarray(vmag, dtype=float)), 
+                                              np.atleast_1d(np.asarray(snr, dtype=float)))
+        if not len(snr):
+            return np.zeros(0)
+        # SNR of every target at every exposure time node of the grid (targets x nodes)
+        nodes = np.arange(len(self.exptime), dtype=float)
+        teff_location, vmag_location = self.locate(teff, vmag)
+        points = np.stack(np.broadcast_arrays(nodes[None,:], vmag_location[:,None], teff_location[:,None]), axis=-1)
+        snr_nodes = np.maximum.accumulate(self.interpolator(points), axis=1)
+        # monotone table inversion for the fractional exposure time index
+        j = np.clip(np.sum(snr_nodes < snr[:,None], axis=1)-1, 0, len(nodes)-2)
+        rows = np.arange(len(snr))
+        low, high = snr_nodes[rows,j], snr_nodes[rows,j+1]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            location = j + np.clip(np.where(high > low, (snr-low)/(high-low), 0.), 0., 1.)
+        # bracket the exposure time of that index (the index is monotonic in log exposure time)
+        lower, upper = np.full(len(snr), self.logexp.min()), np.full(len(snr), self.logexp.max())
+        for _ in range(60):
+            middle = (lower+upper)/2.
+            below = self.exptime_index(middle) < location
+            lower, upper = np.where(below, middle, lower), np.where(below, upper, middle)
+        return np.where(snr_nodes[:,-1] < snr, np.nan, 10.**upper)
+
+
+    def exposure_time(self, teff, vmag, snr, step=2):
+        """
+        Estimates the exposure times required to reach a specified signal-to-noise 
+        value (snr) for an array of stellar targets.
+
+        Parameters
+        ----------
+        teff : numpy.ndarray
+            target effective temperatures
+        vmag : numpy.ndarray
+            target V magnitudes
+        snr : numpy.ndarray
+            desired spectral SNR
+        step : int
+            shortest trial exposure time (in seconds) above the shortest exposure time of the grid (default is `2`)
+
+        Returns
+        -------
+        exp_time : numpy.ndarray
+            estimated exposure times (in seconds) for reaching the specified snr
+
+        """
+        teff, vmag, snr = np.broadcast_arrays(np.atleast_1d(np.asarray(teff, dtype=float)), 
+                                              np.atleast_1d(np.asarray(vmag, dtype=float)), 
+                                              np.atleast_1d(np.asarray(snr, dtype=float)))
+        if not len(snr):
+            return np.zeros(0)
+        exp_time = self.invert(teff, vmag, snr)
+        if np.any(np.isnan(exp_time)):
+            raise ValueError("the desired SNR of %d target(s) is beyond the KPF exposure time grid"%np.sum(np.isnan(exp_time)))
+        teff_location, vmag_location = self.locate(teff, vmag)
+        # first trial exposure time (in steps of 1 second) that reaches the desired SNR
+        time_0 = self.exptime.min()
+        trial = np.maximum(np.ceil(exp_time-time_0-1e-9), step)
+        for _ in range(len(self.exptime)+10):
+            short = (trial > step) & (self.get_snr(teff_location, vmag_location, time_0+trial-1.) >= snr)
+            long = self.get_snr(teff_location, vmag_location, time_0+trial) < snr
+            if not np.any(short | long):
+                break
+            trial = trial - short + long
+        return time_0+trial
+
+
+    def get_table(self, shape=(48, 96, 96)):
+        """
+        Tabulates the (log) exposure times over a dense (teff, vmag, log snr) grid that 
+        spans the photon grids (see `tables.LookupTable`).
+
+        Parameters
+        ----------
+        shape : Tuple[int]
+            number of effective temperatures, V magnitudes and SNRs of the table
+
+        Returns
+        -------
+        table : tables.LookupTable
+            the lookup table of log exposure times
+
+        """
+        snr = self.snr_grid[self.snr_grid > 0.]
+        axes = [np.linspace(self.teff.min(), self.teff.max(), shape[0]), 
+                np.linspace(self.vmag.min(), self.vmag.max(), shape[1]),
+                np.linspace(np.log10(max(snr.min(), 1.)), np.log10(snr.max()), shape[2])]
+        values = tabulate(lambda teff, vmag, logsnr: np.log10(self.invert(teff, vmag, 10.**logsnr)), axes)
+        return LookupTable(axes, values, info={'time_0':float(self.exptime.min())})
+
+
+KPF_FILES = ['photon_grid_teff.fits', 'photon_grid_vmag.fits', 'photon_grid_exptime.fits', 'order_wvl_centers.fits', 'snr_master_order.fits']
+_KPF_GRIDS, _KPF_TABLES = {}, {}
+
+def get_kpf_grid(path=None, wavelength=550.0):
+    """
+    Reads the KPF photon grids (in the 'info' directory by default) and builds their 
+    interpolators, which only happens once per process (for a given path and wavelength).
+
+    Parameters
+    ----------
+    path : Optional[str]
+        directory with the photon grids (default is 'info' in the current working directory)
+    wavelength : float
+        wavelength (in nm) of the desired SNR, i.e. the closest order is used (default is `550.0`)
+
+    Returns
+    -------
+    grid : observing.KPFGrid
+        the KPF SNR grid
+
+    """
+    if path is None:
+        path = os.path.join(os.path.abspath(os.getcwd()), 'info')
+    key = (os.path.abspath(path), float(wavelength))
+    if key not in _KPF_GRIDS:
+        if fits is None:
+            raise ImportError("KPF exposure times require astropy to read the photon grids")
         # find closest order to specified wavelength
-        wvl_ords = np.array(fits.getdata(wvl_ord_file)[1])
+        wvl_ords = np.array(fits.getdata(os.path.join(path, 'order_wvl_centers.fits'))[1])
         idx = (np.abs(wvl_ords - wavelength)).argmin()
-        snr_grid = snr_grid_all[idx]
-        # read in data cubes and arrays
-        teff_grid = fits.getdata(teff_grid_file)
-        vmag_grid = fits.getdata(vmag_grid_file)
-        exptime_grid = fits.getdata(exp_time_grid_file)
-        logexp = np.log10(exptime_grid)
-        # Get fractional indices for relevant input parameters
-        teff_index_spline = InterpolatedUnivariateSpline(teff_grid,np.arange(len(teff_grid),dtype=np.double))
-        vmag_index_spline = InterpolatedUnivariateSpline(vmag_grid,np.arange(len(vmag_grid),dtype=np.double))
-        teff_location = teff_index_spline(self.teff)
-        vmag_location = vmag_index_spline(self.vmag)
-        # while trial exposure time yields worse precision, keep increasing until
-        # you reach specified sigma_rv
-        while minout < self.snr:
-            # dummy guess trial exposure
-            trial_exp = min(exptime_grid)+ind
-            # fractional index for trial exposure time in exptime_grid
-            exptime_index = InterpolatedUnivariateSpline(logexp, np.arange(len(exptime_grid),dtype=np.double))(np.log10(trial_exp))
-            # recompute expected SNR based on trial exposure time
-            snr_interpolator = RegularGridInterpolator((np.arange(len(exptime_grid)),np.arange(len(vmag_grid)),np.arange(len(teff_grid))),snr_grid)
-            inputs = [exptime_index, vmag_location, teff_location]
-            # store as new maximum
-            minout = snr_interpolator(inputs)[0]
-            # increase exposure time by 1 second
-            ind += 1
-        # last 'trial' exposure time is correct answer
-        self.exp_time = trial_exp
\ No newline at end of file
+        snr_grid = fits.getdata(os.path.join(path, 'snr_master_order.fits'))[idx]
+        _KPF_GRIDS[key] = KPFGrid(fits.getdata(os.path.join(path, 'photon_grid_teff.fits')), 
+                                  fits.getdata(os.path.join(path, 'photon_grid_vmag.fits')),
+                                  fits.getdata(os.path.join(path, 'photon_grid_exptime.fits')), snr_grid)
+    return _KPF_GRIDS[key]
+
+
+def get_kpf_table(path=None, wavelength=550.0):
+    """
+    Loads the KPF lookup table of exposure times (see `KPFGrid.get_table`), which is 
+    saved next to the photon grids as 'kpf_exptime_<wavelength>.npy' and memory mapped.
+    The table is only (re)built when the photon grids change (i.e. their hash).
+
+    Parameters
+    ----------
+    path : Optional[str]
+        directory with the photon grids (default is 'info' in the current working directory)
+    wavelength : float
+        wavelength (in nm) of the desired SNR (default is `550.0`)
+
+    Returns
+    -------
+    table : tables.LookupTable
+        the lookup table of log exposure times
+
+    """
+    if path is None:
+        path = os.path.join(os.path.abspath(os.getcwd()), 'info')
+    key = (os.path.abspath(path), float(wavelength))
+    if key not in _KPF_TABLES:
+        files = [os.path.join(path, file) for file in KPF_FILES]
+        _KPF_TABLES[key] = get_table(os.path.join(path, 'kpf_exptime_%g'%wavelength), 
+                                     lambda: get_kpf_grid(path=path, wavelength=wavelength).get_table(), 
+                                     files, wavelength=float(wavelength), version=1)
+    return _KPF_TABLES[key]
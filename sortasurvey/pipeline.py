@@ -1,5 +1,7 @@
 import os
+import argparse
 import subprocess
+import multiprocessing
 import numpy as np
 import pandas as pd
 import time as clock
@@ -8,64 +10,310 @@ pd.set_option('mode.chained_assignment', None)
 import sortasurvey
 from sortasurvey import utils
 from sortasurvey.survey import Survey
-from sortasurvey.sample import Sample
+from sortasurvey.shared import shared_memory
+from sortasurvey.streams import SCHEMES, effective_sample_size, get_fractions, paired_variance
+from sortasurvey.writer import DataWriter
 
 
-def rank(args, stuck=0):
+def rank(args):
     """
     Initializes the Survey class and runs the ranking algorithm to determine
     a final prioritized list of targets while balancing various sub-science 
     goals using the provided selection criteria and prioritization metrics. 
-    The selection process will continue until either:
-    1) the allocated survey time is successfully exhausted (i.e. == 0), or 
-    2) all programs in the survey are 'stuck' (i.e. cannot afford their next highest priority pick).
+    Monte-Carlo iterations are independent (see `select`) and are spread across 
+    a pool of processes when more than one worker is requested (via args.workers),
+    in which case the results are merged back in iteration order. The read-only 
+    sample is then moved into shared memory (see `Survey.share`) so that workers 
+    attach to it rather than copying it. The data products of MC iterations are 
+    saved by a background writer (see `writer.DataWriter`) while the next iteration 
+    runs, which is flushed when the ranking finishes (or fails). With args.bundle,
+    the data products of all iterations are saved to a single NPZ bundle (see 
+    `bundle.ResultBundle`) rather than a directory per iteration. With args.converge,
+    the MC iterations stop as soon as the selection probabilities and mean priorities 
+    of all targets have converged (see `converged`), where args.iter is the maximum
+    number of iterations. With args.ess, the sampling schemes are compared instead
+    (see `compare`).
 
     Parameters
     ----------
     args : argparse.Namespace
         the command line arguments
-    stuck : int
-        the number of programs currently 'stuck' in the Survey. This variable resets to 0 any time a new selection is made
 
     """
 
+    if args.ess:
+        compare(args)
+        return
     # init Survey class
     survey = Survey(args)
     ti = clock.time()
-    # Monte-Carlo simulations of sampler (args.iter=1 by default)
-    for n in range(1,args.iter+1):
-        survey.n = n
-        survey.reset_track()
-        # Begin selection process 
-        while np.sum(survey.sciences.remaining_hours.values.tolist()) > 0.:
-            # Select program
-            survey.pick_program()
-            # Create an instance of the Sample class w/ the updated vetted sample
-            s = Sample(survey, program)
-            # pick highest priority target not yet selected
-            pick = s(program)
-            if pick is None:
-                continue
-            # what is the cost of the selected target
-            cost = float((pick.actual_cost))/3600.
-            # if the program cannot afford the target, it is "stuck"
-            if cost > survey.sciences.loc[program,'remaining_hours']:
-                stuck += 1
-            else:
-                # reset counter
-                stuck = 0
-                # update records with the program pick
-                survey.update(pick, program)
-            if stuck >= len(survey.sciences):
-                break
-        if survey.emcee:
-            survey.df = survey.candidates.copy()
-            utils.make_data_products(survey)
-
-    tf = clock.time()
-    survey.ranking_time = float(tf-ti)
-    survey.df = survey.candidates.copy()
-    utils.make_data_products(survey)
+    try:
+        # Monte-Carlo simulations of sampler (args.iter=1 by default)
+        if survey.params['workers'] > 1 and survey.emcee:
+            if shared_memory is not None:
+                survey.share()
+            try:
+                with multiprocessing.Pool(survey.params['workers'], initializer=init_worker, initargs=(survey,)) as pool:
+                    # the writer thread is only started once the workers were forked
+                    get_writer(survey)
+                    for n, results in pool.imap(run_iteration, range(1,args.iter+1)):
+                        survey.set_results(n, results)
+                        survey.ranking_time = float(clock.time()-ti)
+                        survey.df = survey.candidates.copy()
+                        utils.make_data_products(survey)
+                        if converged(survey):
+                            break
+            finally:
+                survey.unshare()
+        else:
+            get_writer(survey)
+            for n in range(1,args.iter+1):
+                survey.n = n
+                select(survey)
+                survey.ranking_time = float(clock.time()-ti)
+                if survey.emcee:
+                    survey.df = survey.candidates.copy()
+                    utils.make_data_products(survey)
+                    if converged(survey):
+                        break
+        if survey.rankings is not None:
+            utils.emcee_rankings(survey)
+    except BaseException:
+        # the error that stopped the ranking takes precedence over any write errors
+        close(survey, quiet=True)
+        raise
+    # flush the data products that are still being written
+    close(survey)
+    if not survey.emcee:
+        survey.df = survey.candidates.copy()
+        utils.make_data_products(survey)
+
+
+def get_writer(survey):
+    """
+    Starts the background writer of the per-iteration data products (see `writer.DataWriter`),
+    which is only needed for MC runs that save their output.
+
+    """
+    if survey.emcee and survey.save:
+        survey.writer = DataWriter()
+
+
+def close(survey, quiet=False):
+    """
+    Flushes the data products that are still being written (see `writer.DataWriter`) and
+    closes the NPZ bundle (see `bundle.ResultBundle`). The bundle is always closed, even if
+    the writer failed, so that it stays readable.
+
+    Parameters
+    ----------
+    survey : survey.Survey
+        the survey to close the writer and bundle of
+    quiet : bool
+        ignore errors raised while closing, i.e. when the ranking already failed (default is `False`)
+
+    """
+    writer, bundle = survey.writer, survey.bundle
+    survey.writer, survey.bundle = None, None
+    try:
+        if writer is not None:
+            writer.close()
+    except Exception:
+        if not quiet:
+            raise
+    finally:
+        try:
+            if bundle is not None:
+                bundle.close()
+        except Exception:
+            if not quiet:
+                raise
+
+
+def converged(survey):
+    """
+    Checks whether the MC iterations can stop early (only with args.converge), i.e. when
+    the standard errors of the selection probabilities and (relative) mean priorities of
+    all targets are below args.tol (see `aggregate.RankingAggregator.converged`).
+
+    Parameters
+    ----------
+    survey : survey.Survey
+        the survey after the data products of iteration survey.n were made
+
+    Returns
+    -------
+    converged : bool
+        `True` if the remaining MC iterations can be skipped
+
+    """
+    if not survey.params['converge'] or survey.rankings is None or survey.n >= survey.iter:
+        return False
+    if not survey.rankings.converged(survey.params['tol']):
+        return False
+    if survey.verbose:
+        if survey.progress:
+            survey.pbar.close()
+        print("   - MC converged after %d steps (tol=%s)"%(int(survey.n), survey.params['tol']))
+        print("   - algorithm took %d seconds to run"%(int(survey.ranking_time)))
+    return True
+
+
+def select(survey, stuck=0):
+    """
+    Runs a single iteration of the selection process (i.e. for iteration survey.n), 
+    starting from the initial conditions (see `Survey.reset_track`). The selection 
+    process will continue until either:
+    1) the allocated survey time is successfully exhausted (i.e. == 0), or 
+    2) all programs in the survey are 'stuck' (i.e. cannot afford their next highest priority pick).
+
+    Parameters
+    ----------
+    survey : survey.Survey
+        the survey to run the selection process for
+    stuck : int
+        the number of programs currently 'stuck' in the Survey. This variable resets to 0 any time a new selection is made
+
+    """
+    survey.reset_track()
+    rng = survey.rng
+    # Begin selection process 
+    while survey.state.total_hours > 0.:
+        # Select program
+        survey.pick_program(rng)
+        # no program has targets and time left
+        if survey.program is None:
+            break
+        # Get the program's (long-lived) queue of targets
+        queue = survey.queues[survey.program]
+        # pick highest priority target not yet selected and check whether the
+        # program can afford it, otherwise it is "stuck"
+        if queue():
+            if queue.pick is None:
+                survey.exhaust()
+            stuck += 1
+        else:
+            # reset counter
+            stuck = 0
+            # update records with the program pick
+            survey.update(queue)
+        if stuck >= len(survey.state.programs):
+            break
+
+
+def compare(args, delta=0.1):
+    """
+    Compares the effective sample size (ESS) of the MC selection frequencies of targets
+    for every sampling scheme (see `streams.DrawStream`), using args.ess independent 
+    replicates (with root seeds args.seed, args.seed+1, ...) of args.iter iterations each.
+    The gain of common random numbers (CRN) is estimated for the difference in selection
+    frequencies with the same survey with a fraction `delta` fewer nights. The report is printed and
+    saved to the output directory as 'sampling_report.csv' (with args.save).
+
+    Parameters
+    ----------
+    args : argparse.Namespace
+        the command line arguments
+    delta : float
+        fractional difference in the number of nights of the survey that is compared with CRN (default is `0.1`)
+
+    Returns
+    -------
+    report : pandas.DataFrame
+        the ESS of every scheme (and CRN) and its gain over independent iterations
+
+    """
+    survey = Survey(args)
+    selections, rows = {}, []
+    for scheme in SCHEMES:
+        selections[scheme] = run_replicates(survey, scheme, args.ess)
+        ess = effective_sample_size(get_fractions(selections[scheme]), survey.iter)
+        rows.append([scheme, survey.iter, args.ess, round(ess, 1), round(ess/survey.iter, 2)])
+    # same seeds (i.e. CRN) for a survey with fewer nights
+    other = argparse.Namespace(**vars(args))
+    other.nights = args.nights*(1.-delta)
+    paired, independent = paired_variance(get_fractions(selections['iid']), 
+                                          get_fractions(run_replicates(Survey(other), 'iid', args.ess)))
+    gain = independent/paired if paired > 0. else np.inf
+    rows.append(['crn', survey.iter, args.ess, round(survey.iter*gain, 1), round(gain, 2)])
+    report = pd.DataFrame(rows, columns=['scheme', 'iterations', 'replicates', 'ess', 'gain'])
+    print(report.to_string(index=False))
+    if args.save:
+        if not os.path.exists(args.outdir):
+            os.makedirs(args.outdir)
+        report.to_csv(os.path.join(args.outdir, 'sampling_report.csv'), index=False)
+    return report
+
+
+def run_replicates(survey, scheme, replicates):
+    """
+    Runs independent replicates of survey.iter MC iterations with a given sampling scheme,
+    where the rth replicate uses the root seed args.seed+r.
+
+    Parameters
+    ----------
+    survey : survey.Survey
+        the survey to run the selection process for
+    scheme : str
+        the sampling scheme (see `streams.DrawStream`)
+    replicates : int
+        the number of replicates
+
+    Returns
+    -------
+    selections : List[List[numpy.ndarray]]
+        the TOIs selected in every iteration, for every replicate
+
+    """
+    seed, selections = survey.params['seed'], []
+    survey.params['sampling'] = scheme
+    for r in range(replicates):
+        survey.params['seed'] = seed+r
+        survey.get_seeds()
+        tois = []
+        for n in range(1, survey.iter+1):
+            survey.n = n
+            select(survey)
+            track = survey.track.pop(n)
+            tois.append(track.toi[1:track.n].copy())
+        selections.append(tois)
+        if survey.verbose:
+            print("   - %s: replicate %d/%d done"%(scheme, r+1, replicates))
+    survey.params['seed'] = seed
+    survey.get_seeds()
+    return selections
+
+
+def init_worker(survey):
+    """
+    Stores a copy of the survey in a worker process of the MC process pool.
+
+    """
+    global _survey
+    _survey = survey
+
+
+def run_iteration(n):
+    """
+    Runs the nth MC iteration in a worker process. Every iteration draws from its
+    own seed stream (see Survey.get_seeds), so the results are identical to a serial run.
+
+    Parameters
+    ----------
+    n : int
+        iteration number
+
+    Returns
+    -------
+    n : int
+        iteration number
+    results : dict
+        the iteration's results (see `Survey.get_results`)
+
+    """
+    _survey.n = n
+    select(_survey)
+    return n, _survey.get_results()
 
 
 def setup(args, note='', source='https://raw.githubusercontent.com/ashleychontos/sort-a-survey/main/examples/'):
@@ -1,9 +1,9 @@
 import os
 import glob
+import heapq
 import numpy as np
 import pandas as pd
 
-from sortasurvey.observing import Instrument
 
 
 class Sample:
@@ -19,6 +19,12 @@ class Sample:
         vetted sample from the survey.Survey
     programs : pandas.DataFrame
         survey programs from the survey.Survey 
+    costs : numpy.ndarray
+        the survey's target x program matrix of raw costs (shared, not copied)
+    filters : filters.FilterCompiler
+        the survey's compiled program filters
+    index : index.TargetIndex
+        the survey's TIC and TOI lookup index
 
     Parameters
     ----------
@@ -39,7 +45,8 @@ class Sample:
         self.df = survey.candidates.copy()
         self.programs = survey.sciences.copy()
         self.program = survey.program
-        self.instrument = Instrument(survey)
+        self.costs, self.program_ids = survey.costs, survey.program_ids
+        self.filters, self.index = survey.filters, survey.index
         self.get_vetted_science()
 
 
@@ -73,7 +80,7 @@ class Sample:
             option to drop duplicate targets in the sample query, since the target will only be observed once. As a result, the default is `True`.
 
         """
-        self.query = self.df.query(self.programs.loc[self.program,'filter'])
+        self.query = self.df[self.filters.mask(self.program)]
         if drop_dup:
             self.query = self.query.drop_duplicates(subset='tic')
         self.get_current_costs()
@@ -81,17 +88,18 @@ class Sample:
         if self.programs.loc[self.program,'high_priority'] != []:
             top = pd.DataFrame(columns=self.query.columns.values.tolist())
             for toi in self.programs.loc[self.program,'high_priority']:
-                self.query = self.df.query('toi == %.2f'%toi)
+                self.query = self.df.loc[[row for row in [self.index.get_row(toi)] if row is not None]]
                 self.get_current_costs()
                 top = pd.concat([top,self.query])
             self.query = pd.concat([top,self.query_copy])
         self.query.reset_index(drop=True, inplace=True)
 
 
-    def get_current_costs(self, current_costs=[]):
+    def get_current_costs(self):
         """
         Called during each sampling step to recompute the most up-to-date costs
-        for a given target based on past algorithm selections
+        for a given target based on past algorithm selections. Raw costs are read
+        from the survey's precomputed cost matrix rather than recomputed
 
         Parameters
         ----------
@@ -108,19 +116,8 @@ class Sample:
             the relevant vetted sample updated with actual target costs
     
         """
-        for index in self.query.index.values.tolist():
-            costs = []
-            teff, vmag, template, nobs = self.query.loc[idx, 'teff'], self.query.loc[idx,'vmag'], self.query.loc[idx,'template'], self.query.loc[idx,'nobs']
-            for science in self.programs.index.values.tolist():
-                if self.query.loc[index,'in_%s'%science]:
-                    costs.append(self.instrument(teff, vmag, self.programs.loc[science,'method'], template=template, nobs=nobs))
-            costs.append(self.instrument(teff, vmag, self.programs.loc[self.program,'method'], template=template, nobs=nobs))
-            if float(np.sum(costs)) != 0.:
-                fraction = costs[-1]/np.sum(costs)
-                current_costs.append(fraction*max(costs))
-            else:
-                current_costs.append(0.)
-        self.query['actual_cost'] = np.array(current_costs)
+        members = self.query[['in_%s'%science for science in self.program_ids]].values
+        self.query['actual_cost'] = get_actual_costs(self.costs[self.query.index.values], members, self.program_ids[self.program])
         
 
     def get_highest_priority(self, pick=None):
@@ -148,7 +145,7 @@ class Sample:
         self.pick = pick
 
 
-    def get_net_costs(self, costs=[], cases=[]):
+    def get_net_costs(self):
         """
         Based on the selected program's pick, calculates the credit/debit amounts
         for any program that has selected the same target.
@@ -174,21 +171,22 @@ class Sample:
             to the amount of time to credit or debit the program back
 
         """
-        index = self.df.index[self.df['tic'] == int(self.pick.tic)].tolist()[0]
-        teff, vmag, template, nobs = self.df.loc[index,'teff'], self.df.loc[index,'vmag'], self.df.loc[index,'template'], self.df.loc[index,'nobs']
+        index = self.index.get_rows(self.pick.tic)[0]
+        costs, cases = [], []
         for science in self.programs.index.values.tolist():
+            # costs are on each program's own instrument, so targets are also shared across instruments
             if self.pick['in_%s'%science]:
                 cases.append(science)
-                costs.append(self.instrument(teff, vmag, self.programs.loc[science]['method'], template=template, nobs=nobs))
+                costs.append(self.costs[index,self.program_ids[science]])
         cases.append(self.program)
         if float(np.sum(costs)) == 0.:
             net_costs = -1.*np.zeros(len(cases))
         else:
-            frac = costs/np.sum(costs)
+            frac = np.array(costs)/np.sum(costs)
             old_costs = list((max(costs)/3600.)*frac)
             old_costs.append(0)
-            costs.append(self.instrument(teff, vmag, self.programs.loc[self.program]['method'], template=template, nobs=nobs))
-            new_frac = costs/np.sum(costs)
+            costs.append(self.costs[index,self.program_ids[self.program]])
+            new_frac = np.array(costs)/np.sum(costs)
             new_costs = np.array((max(costs)/3600.)*new_frac)
             net_costs = -1.*(new_costs - np.array(old_costs))
         return dict(zip(cases,net_costs))
@@ -268,4 +266,260 @@ class Sample:
         latest_file = max(list_of_files, key=os.path.getctime)
         df = pd.read_csv(latest_file)
         df.query("in_%s == 1"%program, inplace=True)
-        return df
\ No newline at end of file
+        return df
+
+
+
+class ProgramQueue(Sample):
+    """
+    Long-lived version of the Sample for a single program, which is built once per 
+    selection process (i.e. MC iteration) instead of at every pick. Targets passing the 
+    program's filter are kept in a heap keyed by the program's `prioritize_by` and 
+    `ascending_by` metrics. When a target's memberships change, a new entry is pushed
+    for the target and the older entry is lazily invalidated, so that selecting the
+    highest priority target is a peek at the top of the heap.
+
+    Attributes
+    ----------
+    survey : survey.Survey
+        the survey the queue belongs to (the sample, programs and costs are not copied)
+    heap : List[tuple]
+        heap of (key, row, version) entries
+    versions : Dict[int,int]
+        the current version of each row's heap entry
+    representative : Dict[int,int]
+        the row that represents a given TIC in the program (i.e. the first row to pass the filter)
+    high_priority : List[int]
+        rows of the program's high priority targets, which are always selected first
+    static : bool
+        `True` if neither the program's filter nor its heap keys depend on the selection
+        (e.g. memberships or `actual_cost`), in which case changed rows never need to be re-positioned
+    order : List[tuple]
+        the program's (prioritize_by, ascending_by) pairs of the heap keys
+
+    Parameters
+    ----------
+    survey : survey.Survey
+        the survey to select targets for
+    program : str
+        selected program of interest within a survey
+
+    """
+
+    def __init__(self, survey, program):
+        self.survey = survey
+        self.program = program
+        self.pick = None
+        self.get_vetted_science()
+
+
+    @property
+    def df(self):
+        return self.survey.candidates
+
+
+    def __call__(self):
+        self.get_highest_priority()
+        if self.pick is not None:
+            cost = float((self.pick.actual_cost))/3600.
+            return cost > self.survey.state.remaining_hours[self.program_ids[self.program]]
+        return True
+
+
+    @property
+    def programs(self):
+        return self.survey.programs
+
+
+    @property
+    def costs(self):
+        return self.survey.costs
+
+
+    @property
+    def program_ids(self):
+        return self.survey.program_ids
+
+
+    @property
+    def filters(self):
+        return self.survey.filters
+
+
+    @property
+    def index(self):
+        return self.survey.index
+
+
+    def get_vetted_science(self):
+        """
+        Builds the program's heap from the survey sample (via survey.candidates), keeping
+        only the first row of a given TIC that passes the program's filter.
+
+        """
+        self.heap, self.versions, self.representative = [], {}, {}
+        self.high_priority = []
+        columns = set(self.survey.get_selection_columns()) | {'actual_cost'}
+        self.order = list(zip(self.programs.loc[self.program,'prioritize_by'], self.programs.loc[self.program,'ascending_by']))
+        self.static = not (self.filters.columns(self.program) & columns) and not ({by for by, _ in self.order} & columns)
+        for toi in self.programs.loc[self.program,'high_priority']:
+            row = self.index.get_row(toi)
+            if row is not None:
+                self.high_priority.append(row)
+        rows = np.flatnonzero(self.filters.mask(self.program))
+        tics, first = np.unique(self.df.get('tic', rows), return_index=True)
+        rows = rows[first]
+        self.representative = dict(zip(tics.tolist(), rows.tolist()))
+        for key, row in zip(self.get_keys(rows), rows.tolist()):
+            self.versions[row] = 0
+            self.heap.append((key, row, 0))
+        heapq.heapify(self.heap)
+
+
+    def get_keys(self, rows):
+        """
+        Computes the heap keys for the given rows. Missing values are always ranked
+        last, consistent with `pandas.DataFrame.sort_values`.
+
+        Parameters
+        ----------
+        rows : numpy.ndarray
+            rows of the survey.candidates dataframe
+
+        Returns
+        -------
+        keys : List[tuple]
+            the heap key of each row
+
+        """
+        columns = []
+        for by, ascending in self.order:
+            if by == 'actual_cost':
+                values = self.get_actual_costs(rows)
+            else:
+                values = self.df.get(by, rows).astype(float)
+            missing = np.isnan(values)
+            if not ascending:
+                values = -1.*values
+            columns += [missing.tolist(), np.where(missing, 0., values).tolist()]
+        return list(zip(*columns))
+
+
+    def get_actual_costs(self, rows):
+        """
+        Current (i.e. shared) costs of the given rows for the program.
+
+        """
+        return get_actual_costs(self.costs[rows], self.survey.state.members[rows], self.program_ids[self.program])
+
+
+    def update(self, rows):
+        """
+        Re-positions the stars of the given (changed) rows in the program's queue. Nothing
+        needs to be done for static programs (see `ProgramQueue.static`), since a target that
+        was selected by the program itself is skipped when it reaches the top of the heap.
+
+        Parameters
+        ----------
+        rows : List[int]
+            rows of the survey.candidates dataframe that changed since the last pick
+
+        """
+        if self.static:
+            return
+        tics = []
+        for tic in self.df.get('tic', rows).tolist():
+            if tic not in tics:
+                tics.append(tic)
+        for tic in tics:
+            self.update_star(self.index.get_rows(tic))
+
+
+    def update_star(self, rows):
+        """
+        Re-positions a star in the program's queue after its memberships changed. The
+        (cached) filter mask is checked for the star's rows, since filters may depend on
+        the selection (e.g. `in_other_programs`), and a new entry is pushed for the star's
+        representative row, which invalidates any older entries.
+
+        Parameters
+        ----------
+        rows : List[int]
+            rows of the survey.candidates dataframe belonging to a single star
+
+        """
+        for row in rows:
+            if row in self.versions:
+                self.versions[row] += 1
+        passed = np.array(rows)[self.filters.mask(self.program, rows=rows)]
+        tic = int(self.df.get('tic', rows[0]))
+        if not len(passed):
+            self.representative.pop(tic, None)
+            return
+        row = int(passed[0])
+        self.representative[tic] = row
+        self.versions[row] = self.versions.get(row, -1) + 1
+        heapq.heappush(self.heap, (self.get_keys([row])[0], row, self.versions[row]))
+
+
+    def get_highest_priority(self):
+        """
+        Returns the highest priority target for the program that has not yet been 
+        selected by the program. Stale entries at the top of the heap are discarded.
+
+        Returns
+        -------
+        pick : pandas.Series
+            the selected's program's highest priority pick
+
+        """
+        self.pick = None
+        members = self.survey.state.members[:,self.program_ids[self.program]]
+        for row in self.high_priority:
+            if not members[row]:
+                self.pick = self.get_pick(row)
+                return
+        while self.heap:
+            key, row, version = self.heap[0]
+            if version != self.versions[row] or members[row]:
+                heapq.heappop(self.heap)
+                continue
+            self.pick = self.get_pick(row)
+            return
+
+
+    def get_pick(self, row):
+        return self.df.row(row, actual_cost=self.get_actual_costs([row])[0])
+
+
+def get_actual_costs(costs, members, j):
+    """
+    Computes the current cost of targets for a program, given the programs that already
+    selected the targets. The program is charged its fraction of the summed raw costs
+    times the largest raw cost. Raw costs are on each program's own instrument, so a target
+    shared across instruments is charged its largest per-instrument cost, which credits
+    the programs on the other instruments.
+
+    Parameters
+    ----------
+    costs : numpy.ndarray
+        target x program matrix of raw costs
+    members : numpy.ndarray
+        target x program matrix of program memberships
+    j : int
+        column of the program in the cost matrix
+
+    Returns
+    -------
+    actual_costs : numpy.ndarray
+        the current cost of each target for the program
+
+    """
+    members = np.asarray(members).astype(bool)
+    own = costs[:,j]
+    total = own + np.sum(np.where(members, costs, 0.), axis=1)
+    largest = np.maximum(own, np.max(np.where(members, costs, 0.), axis=1, initial=0.))
+    actual_costs = np.zeros(len(own))
+    nonzero = total != 0.
+    actual_costs[nonzero] = (own[nonzero]/total[nonzero])*largest[nonzero]
+    return actual_costs
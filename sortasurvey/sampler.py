@@ -0,0 +1,95 @@
+class ProgramSampler:
+    """
+    Weighted sampler for the programs in a survey, which is based on a Fenwick (or binary
+    indexed) tree of the program weights (i.e. their remaining hours). Updating a single
+    weight and drawing a program are both O(log(n_programs)), and programs with non-positive
+    weights are never drawn.
+
+    Parameters
+    ----------
+    weights : List[float]
+        the initial weight of each program
+
+    Attributes
+    ----------
+    weights : List[float]
+        the current (non-negative) weight of each program
+    tree : List[float]
+        the Fenwick tree of partial sums
+    positive : int
+        the number of programs with a positive weight
+
+    """
+
+    def __init__(self, weights):
+        self.n = len(weights)
+        self.weights = [0.]*self.n
+        self.tree = [0.]*(self.n+1)
+        self.positive = 0
+        for i, weight in enumerate(weights):
+            self.update(i, weight)
+
+
+    def update(self, i, weight):
+        """
+        Sets the weight of the ith program. Missing and negative weights are set to `0`.
+
+        Parameters
+        ----------
+        i : int
+            index of the program
+        weight : float
+            the new weight of the program
+
+        """
+        weight = float(weight)
+        if not weight > 0.:
+            weight = 0.
+        self.positive += (weight > 0.) - (self.weights[i] > 0.)
+        delta, self.weights[i] = weight-self.weights[i], weight
+        i += 1
+        while i <= self.n:
+            self.tree[i] += delta
+            i += i & (-i)
+
+
+    @property
+    def total(self):
+        # prefix sum of all weights from the tree, i.e. O(log(n_programs))
+        total, i = 0., self.n
+        while i > 0:
+            total += self.tree[i]
+            i -= i & (-i)
+        return total
+
+
+    def draw(self, u):
+        """
+        Maps a random number from U~[0,1) to a program, i.e. the first program whose
+        cumulative (normalized) weight exceeds the random number.
+
+        Parameters
+        ----------
+        u : float
+            random number in [0,1)
+
+        Returns
+        -------
+        i : Optional[int]
+            index of the drawn program (`None` if no program has a positive weight)
+
+        """
+        if not self.positive:
+            return None
+        total = self.total
+        target, i = u*total, 0
+        bit = 1 << (self.n.bit_length()-1)
+        while bit:
+            if i+bit <= self.n and self.tree[i+bit] <= target:
+                i += bit
+                target -= self.tree[i]
+            bit >>= 1
+        # guards against rounding in the partial sums
+        if i >= self.n or self.weights[i] <= 0.:
+            i = max(j for j in range(self.n) if self.weights[j] > 0.)
+        return i
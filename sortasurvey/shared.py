@@ -0,0 +1,159 @@
+import numpy as np
+import pandas as pd
+try:
+    from multiprocessing import shared_memory
+except ImportError:
+    shared_memory = None
+
+
+
+
+class SharedSample:
+    """
+    Read-only copy of the survey sample (plus any other named arrays, e.g. the cost matrix)
+    that lives in shared memory, so that MC worker processes can attach to it without
+    copying it. Numeric and boolean columns are stored as-is while all other (i.e. string)
+    columns are stored as integer codes, which are only decoded for the rows that are
+    read (see `column`). Only the names and layout of the blocks are pickled, so sending
+    the object to a worker is cheap and the worker attaches on unpickling.
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        the sample to share
+    arrays : Optional[Dict[str,numpy.ndarray]]
+        other (read-only) arrays to share
+
+    Attributes
+    ----------
+    columns : List[str]
+        columns of the sample, in order
+    specs : Dict[str,tuple]
+        the shared memory block name, shape and dtype of each array
+    categories : Dict[str,list]
+        the decoded values for columns stored as integer codes
+    names : Dict[str,str]
+        maps each column of the sample to its shared array
+    decoders : Dict[str,numpy.ndarray]
+        the decoded values (plus `nan` for missing values) of each array of integer codes
+    arrays : Dict[str,numpy.ndarray]
+        views of the shared memory blocks
+
+    """
+
+    def __init__(self, df, arrays={}):
+        if shared_memory is None:
+            raise ImportError("sharing the survey sample requires python>=3.8")
+        self.columns = df.columns.values.tolist()
+        self.specs, self.categories, self.arrays, self.blocks = {}, {}, {}, {}
+        self.owner = True
+        for i, column in enumerate(self.columns):
+            values = df[column].values
+            if values.dtype == object:
+                values, categories = pd.factorize(values)
+                self.categories['column_%d'%i] = categories.tolist()
+            self.put('column_%d'%i, values)
+        self.get_names()
+        for name, values in arrays.items():
+            self.put(name, values)
+
+
+    def __len__(self):
+        return len(self.arrays['column_0']) if self.columns else 0
+
+
+    def __getstate__(self):
+        return {'columns':self.columns, 'specs':self.specs, 'categories':self.categories}
+
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.arrays, self.blocks, self.owner = {}, {}, False
+        self.get_names()
+        for name, (block, shape, dtype) in self.specs.items():
+            self.blocks[name] = shared_memory.SharedMemory(name=block)
+            self.arrays[name] = self.view(name)
+
+
+    def get_names(self):
+        self.names = {column:'column_%d'%i for i, column in enumerate(self.columns)}
+        self.decoders = {name:np.array(categories+[np.nan], dtype=object) for name, categories in self.categories.items()}
+
+
+    def put(self, name, values):
+        """
+        Copies an array into a new shared memory block.
+
+        """
+        values = np.ascontiguousarray(values)
+        block = shared_memory.SharedMemory(create=True, size=max(values.nbytes, 1))
+        self.blocks[name] = block
+        self.specs[name] = (block.name, values.shape, values.dtype.str)
+        self.arrays[name] = self.view(name)
+        self.arrays[name][...] = values
+        self.arrays[name].flags.writeable = False
+
+
+    def view(self, name):
+        block, shape, dtype = self.specs[name]
+        values = np.ndarray(shape, dtype=np.dtype(dtype), buffer=self.blocks[name].buf)
+        if not self.owner:
+            values.flags.writeable = False
+        return values
+
+
+    def get(self, name):
+        """
+        Returns a (read-only, zero-copy) view of a shared array.
+
+        """
+        return self.arrays[name]
+
+
+    def column(self, column, rows=None):
+        """
+        Returns the values of a column of the sample (or of the given rows only), which
+        is a (read-only, zero-copy) view for numeric and boolean columns. String columns
+        are decoded from their integer codes, i.e. only for the requested rows.
+
+        Parameters
+        ----------
+        column : str
+            the column of the sample
+        rows : Optional[numpy.ndarray]
+            only return these rows (default is all rows)
+
+        Returns
+        -------
+        values : numpy.ndarray
+            the values of the column
+
+        """
+        name = self.names[column]
+        values = self.arrays[name] if rows is None else self.arrays[name][rows]
+        if name in self.decoders:
+            values = self.decoders[name][values]
+        return values
+
+
+    def copy(self):
+        """
+        Returns a new (writable) dataframe of the sample, i.e. like `pandas.DataFrame.copy`.
+
+        """
+        data = {column:self.column(column) for column in self.columns}
+        return pd.DataFrame(data, columns=self.columns, copy=True)
+
+
+    def close(self):
+        """
+        Detaches from the shared memory blocks and frees them if this is the process
+        that created them.
+
+        """
+        self.arrays = {}
+        for block in self.blocks.values():
+            block.close()
+            if self.owner:
+                block.unlink()
+        self.blocks = {}
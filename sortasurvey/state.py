@@ -0,0 +1,199 @@
+import numpy as np
+import pandas as pd
+
+from sortasurvey.shared import SharedSample
+
+
+
+
+class SelectionState:
+    """
+    Compact (array-backed) state of a single selection process, which replaces the scalar
+    updates of the survey programs dataframe (i.e. survey.sciences) and of the survey sample
+    (i.e. survey.candidates) inside the selection loop. Programs are referred to by their
+    integer id (i.e. survey.program_ids) and the programs dataframe is only rebuilt when
+    the data products are made (see `to_frame`).
+
+    Parameters
+    ----------
+    programs : pandas.DataFrame
+        the survey programs (via survey.programs) at the start of the selection process
+    members : numpy.ndarray
+        target x program (uint8) membership matrix at the start of the selection process
+    nobs_goal : numpy.ndarray
+        the observing goal of each target at the start of the selection process
+    priority : numpy.ndarray
+        the overall priority of each target at the start of the selection process
+    in_other_programs : numpy.ndarray
+        the number of programs that selected each target at the start of the selection process
+
+    Attributes
+    ----------
+    programs : List[str]
+        the program names, in order of their ids
+    remaining_hours : numpy.ndarray
+        remaining hours of each program
+    pick_number : numpy.ndarray
+        number of targets each program has selected
+    n_targets_left : numpy.ndarray
+        number of targets each program can still select
+    members : numpy.ndarray
+        target x program (uint8) membership matrix, i.e. the 'in_<program>' columns of the sample
+    nobs_goal : numpy.ndarray
+        the observing goal of each target
+    priority : numpy.ndarray
+        the overall priority of each target
+    in_other_programs : numpy.ndarray
+        the number of programs that selected each target
+    ids : Dict[str,int]
+        maps each membership column (i.e. 'in_<program>') to its column in the membership matrix
+
+    """
+
+    __slots__ = ['programs', 'remaining_hours', 'pick_number', 'n_targets_left', 'members',
+                 'nobs_goal', 'priority', 'in_other_programs', 'ids']
+
+    def __init__(self, programs, members, nobs_goal, priority, in_other_programs):
+        self.programs = programs.index.values.tolist()
+        self.remaining_hours = programs['remaining_hours'].values.astype('float64')
+        self.pick_number = programs['pick_number'].values.astype('int64')
+        self.n_targets_left = programs['n_targets_left'].values.astype('int64')
+        self.members = members
+        self.nobs_goal = np.array(nobs_goal)
+        self.priority = np.array(priority)
+        self.in_other_programs = np.array(in_other_programs)
+        self.ids = {'in_%s'%program:j for j, program in enumerate(self.programs)}
+
+
+    def __contains__(self, column):
+        return column in self.ids or column in ('nobs_goal', 'priority', 'in_other_programs')
+
+
+    @property
+    def total_hours(self):
+        return float(np.sum(self.remaining_hours))
+
+
+    def get(self, column):
+        """
+        Returns the current values of a selection column of the survey sample, i.e. a
+        program membership ('in_<program>'), 'nobs_goal', 'priority' or 'in_other_programs'.
+
+        """
+        if column in self.ids:
+            return self.members[:,self.ids[column]]
+        return getattr(self, column)
+
+
+    def to_frame(self, programs):
+        """
+        Converts the state back into the survey programs dataframe.
+
+        Parameters
+        ----------
+        programs : pandas.DataFrame
+            the survey programs (via survey.programs) the state was created from
+
+        Returns
+        -------
+        sciences : pandas.DataFrame
+            copy of the survey programs with the current remaining hours, pick numbers and targets left
+
+        """
+        sciences = programs.copy()
+        sciences['remaining_hours'] = self.remaining_hours.copy()
+        sciences['pick_number'] = self.pick_number.copy()
+        sciences['n_targets_left'] = self.n_targets_left.copy()
+        return sciences
+
+
+
+class CandidateView:
+    """
+    Read-only view of the survey sample during a selection process (i.e. survey.candidates),
+    which joins the static columns of the sample with the selection columns that live in
+    the selection state (see `SelectionState.get`). Columns are returned as arrays without
+    copying them and the full dataframe is only built when it is needed (see `copy`). When
+    the sample lives in shared memory (i.e. in MC workers), the static columns are views of
+    the shared sample, so a selection process only holds its own selection state.
+
+    Parameters
+    ----------
+    sample : Union[pandas.DataFrame,shared.SharedSample]
+        the (read-only) survey sample
+    state : Optional[SelectionState]
+        the selection state (default is `None`, i.e. the selection columns of the sample are used)
+
+    Attributes
+    ----------
+    columns : List[str]
+        columns of the sample, in order
+    arrays : Dict[str,numpy.ndarray]
+        the (zero-copy) arrays of the static columns that were accessed so far
+
+    """
+
+    def __init__(self, sample, state=None):
+        self.sample, self.state = sample, state
+        self.columns = list(sample.columns)
+        self.arrays = {}
+
+
+    def __len__(self):
+        return len(self.sample)
+
+
+    def __getitem__(self, column):
+        return self.get(column)
+
+
+    def get(self, column, rows=None):
+        """
+        Returns the values of a column (or of the given rows only).
+
+        Parameters
+        ----------
+        column : str
+            the column of the sample
+        rows : Optional[numpy.ndarray]
+            only return these rows (default is all rows)
+
+        Returns
+        -------
+        values : numpy.ndarray
+            the values of the column
+
+        """
+        if self.state is not None and column in self.state:
+            values = self.state.get(column)
+        elif isinstance(self.sample, SharedSample):
+            return self.sample.column(column, rows)
+        else:
+            if column not in self.arrays:
+                self.arrays[column] = self.sample[column].values
+            values = self.arrays[column]
+        return values if rows is None else values[rows]
+
+
+    def row(self, row, **values):
+        """
+        Returns a single row of the sample (i.e. like `pandas.DataFrame.loc[row]`), with
+        any other given values (e.g. the actual cost of a target) appended to it.
+
+        """
+        data = [self.get(column, row) for column in self.columns] + list(values.values())
+        return pd.Series(data, index=self.columns+list(values), name=row, dtype=object)
+
+
+    def copy(self):
+        """
+        Returns a new (writable) dataframe of the sample with the current selection
+        columns, i.e. like `pandas.DataFrame.copy`.
+
+        """
+        df = self.sample.copy()
+        if self.state is not None:
+            for column in self.columns:
+                if column in self.state:
+                    df[column] = self.state.get(column).astype(df[column].dtype)
+        return df
@@ -0,0 +1,209 @@
+import numpy as np
+import pandas as pd
+from scipy.stats import qmc
+
+
+
+
+SCHEMES = ['iid', 'antithetic', 'sobol']
+# spawn key of the Sobol' scramble, which is never used by the seeds of the iterations
+SOBOL_KEY = 2**32-1
+
+
+class DrawStream:
+    """
+    Stream of random numbers from U~[0,1) that drive the program draws of a single MC
+    iteration (see `Survey.pick_program`), where the kth draw of an iteration always uses
+    the kth number of its stream. The streams of different iterations are either
+    independent ('iid', the default) or correlated to reduce the variance of the MC
+    estimates (e.g. the selection frequencies of targets):
+
+    1) 'antithetic' : iterations are paired up, where the second iteration of a pair
+       draws 1-u for every u drawn by the first iteration (i.e. both iterations of
+       the nth pair share the seed stream of iteration n)
+    2) 'sobol' : the first `dim` draws of iteration n are the coordinates of the nth point
+       of a scrambled Sobol' sequence (scrambled by the root seed), so that the draws are
+       evenly spread across iterations. The balance properties of the sequence require
+       the number of iterations to be a power of 2. Any draws past `dim` are independent.
+
+    The stream of iteration n only depends on the root seed and n (i.e. not on the survey
+    configuration), so two configurations run with the same root seed use common random
+    numbers, which reduces the variance of their difference (see `paired_variance`).
+
+    Parameters
+    ----------
+    seeds : List[numpy.random.SeedSequence]
+        seed sequence of each iteration (see `Survey.get_seeds`)
+    n : int
+        iteration number
+    scheme : str
+        the sampling scheme, i.e. 'iid', 'antithetic' or 'sobol' (default is 'iid')
+    root : Optional[numpy.random.SeedSequence]
+        the root seed sequence, which scrambles the Sobol' sequence (only needed for 'sobol')
+    dim : int
+        number of draws per iteration taken from the Sobol' sequence (default is `512`)
+    sobol : Optional[streams.SobolSequence]
+        the (scrambled) Sobol' sequence of the run, which is built from the root seed if not provided
+
+    Attributes
+    ----------
+    rng : numpy.random.Generator
+        random number generator of the (independent) draws
+    points : numpy.ndarray
+        the iteration's Sobol' point (empty unless scheme='sobol')
+    i : int
+        number of draws so far
+
+    """
+
+    def __init__(self, seeds, n, scheme='iid', root=None, dim=512, sobol=None):
+        if scheme not in SCHEMES:
+            raise ValueError("unknown sampling scheme '%s' (choose from %s)"%(scheme, ', '.join(SCHEMES)))
+        self.scheme, self.n, self.i = scheme, n, 0
+        self.flip = False
+        if scheme == 'antithetic':
+            self.rng = np.random.default_rng(seeds[(n-1)//2])
+            self.flip = not n % 2
+        else:
+            self.rng = np.random.default_rng(seeds[n-1])
+        if scheme == 'sobol':
+            if sobol is None:
+                sobol = SobolSequence(root, dim=dim)
+            self.points = sobol.point(n)
+        else:
+            self.points = np.empty(0)
+
+
+    def random(self):
+        """
+        Returns the next random number from U~[0,1) of the stream.
+
+        """
+        if self.i < len(self.points):
+            u = float(self.points[self.i])
+        else:
+            u = self.rng.random()
+            if self.flip:
+                u = 1.-u
+        self.i += 1
+        return u
+
+
+class SobolSequence:
+    """
+    Scrambled Sobol' sequence of a run (see `DrawStream`), which is scrambled once by the
+    root seed and then only fast-forwarded to the point of each iteration. Scrambling the
+    engine is by far the most expensive step, so it is built once per run (see `Survey.get_seeds`)
+    instead of once per iteration. The nth point only depends on the root seed and n, i.e.
+    not on the order in which the points are requested (e.g. by MC workers).
+
+    Parameters
+    ----------
+    root : numpy.random.SeedSequence
+        the root seed sequence, which scrambles the sequence
+    dim : int
+        number of coordinates of each point (default is `512`)
+
+    Attributes
+    ----------
+    engine : scipy.stats.qmc.Sobol
+        the scrambled Sobol' engine
+
+    """
+
+    def __init__(self, root, dim=512):
+        self.root, self.dim = root, dim
+        # the engine spawns its generator from the seed it is given, so it gets its own (fresh) seed
+        # sequence, i.e. the scramble does not depend on how many seeds were spawned from the root seed
+        seed = np.random.SeedSequence(root.entropy, spawn_key=tuple(root.spawn_key)+(SOBOL_KEY,), pool_size=root.pool_size)
+        self.engine = qmc.Sobol(d=dim, scramble=True, seed=np.random.default_rng(seed))
+
+
+    def point(self, n):
+        """
+        Returns the nth point of the sequence (i.e. of the nth iteration).
+
+        """
+        # resetting keeps the scramble, so only earlier points need to start over
+        if n-1 < self.engine.num_generated:
+            self.engine.reset()
+        if n-1 > self.engine.num_generated:
+            self.engine.fast_forward(n-1-self.engine.num_generated)
+        return self.engine.random(1)[0]
+
+
+def effective_sample_size(fractions, iter):
+    """
+    Estimates the effective sample size (ESS) of the MC selection frequencies of a
+    sampling scheme from independent replicates of the same number of iterations, i.e.
+    the number of independent iterations that give the same variance. For every target,
+    the variance of independent iterations is p*(1-p)/iter, where p is its selection
+    probability, and the ESS of the scheme is the ratio of the summed variances (over
+    all targets) of independent iterations and of the scheme, times the number of iterations.
+
+    Parameters
+    ----------
+    fractions : pandas.DataFrame
+        replicate x target selection frequencies of the scheme
+    iter : int
+        number of iterations per replicate
+
+    Returns
+    -------
+    ess : float
+        the effective sample size per replicate
+
+    """
+    p = fractions.mean(axis=0).values
+    variance = fractions.var(axis=0, ddof=1).values
+    return float(iter*np.sum(p*(1.-p)/iter)/np.sum(variance))
+
+
+def paired_variance(a, b):
+    """
+    Compares the variance of the difference in the selection frequencies of two survey
+    configurations with and without common random numbers (CRN).
+
+    Parameters
+    ----------
+    a : pandas.DataFrame
+        replicate x target selection frequencies of the first configuration
+    b : pandas.DataFrame
+        replicate x target selection frequencies of the second configuration, where the
+        replicates used the same root seeds as the first configuration (i.e. CRN)
+
+    Returns
+    -------
+    paired : float
+        summed variance (over all targets) of the differences with CRN
+    independent : float
+        summed variance of the differences for independent seeds, i.e. var(a)+var(b)
+
+    """
+    a, b = a.align(b, join='outer', axis=1, fill_value=0.)
+    paired = float(np.sum((a-b).var(axis=0, ddof=1).values))
+    independent = float(np.sum(a.var(axis=0, ddof=1).values + b.var(axis=0, ddof=1).values))
+    return paired, independent
+
+
+def get_fractions(selections):
+    """
+    Converts the selected targets of every iteration of every replicate into a
+    replicate x target dataframe of selection frequencies.
+
+    Parameters
+    ----------
+    selections : List[List[numpy.ndarray]]
+        the TOIs selected in every iteration, for every replicate
+
+    Returns
+    -------
+    fractions : pandas.DataFrame
+        replicate x target selection frequencies
+
+    """
+    rows = []
+    for replicate in selections:
+        counts = pd.Series(np.concatenate([np.unique(tois) for tois in replicate])).value_counts()
+        rows.append(counts/len(replicate))
+    return pd.DataFrame(rows).fillna(0.).reset_index(drop=True)
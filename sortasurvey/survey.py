@@ -5,7 +5,15 @@ from tqdm import tqdm
 pd.set_option('mode.chained_assignment', None)
 
 
-from sortasurvey.observing import Instrument
+from sortasurvey.filters import FilterCompiler
+from sortasurvey.index import TargetIndex
+from sortasurvey.observing import Instrument, parse_method
+from sortasurvey.sample import ProgramQueue
+from sortasurvey.sampler import ProgramSampler
+from sortasurvey.shared import SharedSample
+from sortasurvey.state import CandidateView, SelectionState
+from sortasurvey.streams import DrawStream, SobolSequence
+from sortasurvey.track import TrackBuffer
 
 
 class Survey:
@@ -29,13 +37,41 @@ class Survey:
         show progress bar of selection process (this will only work with the verbose output on)
     sample : pandas.DataFrame
         pandas dataframe containing the sample to select targets from  -> this is not updated, this is preserved
-    candidates : pandas.DataFrame
-        copy of the vetted survey sample dataframe -> this is updated during the selection process
+    candidates : state.CandidateView
+        view of the vetted survey sample with the current selection columns (see `SelectionState`), which is converted to a dataframe via `candidates.copy()`
     programs : pandas.DataFrame
         pandas dataframe containing survey information -> this is not updated, this is preserved
     sciences : pandas.DataFrame
-        copy of the survey programs dataframe -> this is updated during the selection process
-    track : dict
+        copy of the survey programs dataframe -> this is rebuilt from the selection state for the data products (see `get_sciences`)
+    state : state.SelectionState
+        array-backed remaining hours, pick numbers, targets left, memberships, priorities and nobs goals -> this is updated during the selection process
+    index : index.TargetIndex
+        maps TICs and TOIs to their rows in the sample (and candidates)
+    raw_costs : numpy.ndarray
+        target x program matrix of raw costs (in seconds) -> this is not updated, this is preserved
+    costs : numpy.ndarray
+        the cost matrix used during the selection process, which is the (read-only) raw cost matrix since raw costs do not depend on the selection
+    filters : filters.FilterCompiler
+        compiled program filters, which are evaluated once and cached as boolean masks
+    writer : Optional[writer.DataWriter]
+        background writer of the per-iteration data products (MC runs only)
+    rankings : Optional[aggregate.RankingAggregator]
+        running summary of the prioritized lists across MC iterations (see `utils.emcee_rankings`), which is also used to check for convergence (via args.converge)
+    bundle : Optional[bundle.ResultBundle]
+        single file archive of the per-iteration data products (MC runs with args.bundle only)
+    shared : Optional[shared.SharedSample]
+        shared memory copy of the read-only sample, cost matrix and static filter masks for MC workers (see `share`)
+    queues : Dict[str,sample.ProgramQueue]
+        long-lived priority queues of each program -> these are rebuilt for each selection process
+    sampler : sampler.ProgramSampler
+        weighted sampler of the programs that can still make a selection
+    exhausted : set
+        programs that have no targets left to select from
+    dirty : set
+        rows whose memberships, priority or nobs_goal changed since the last pick (see `update`)
+    rng : streams.DrawStream
+        random numbers of the program draws of the current iteration (seeded from survey.seeds, see args.sampling)
+    track : Dict[int,track.TrackBuffer]
         logs each iteration of the target selection
     iter : int
         number of selection process iterations. Default is `1` (via args.iter).
@@ -49,16 +85,17 @@ class Survey:
     def __init__(self, args, inpdir='info', iter=1, sample_fn='survey_sample.csv', 
                  survey_fn='survey_info.csv', priority_fn='high_priority.csv', ignore_fn='no_no.csv', 
                  hours_per_night=10., pool=50., instrument='hires', progress=True, verbose=True, 
-                 notebook=False, archival=True, overhead=2.0, lower=3.0, upper=20.0,):
+                 notebook=False, archival=True, overhead=2.0, lower=3.0, upper=20.0, workers=1, seed=2222, bundle=False, converge=False, tol=0.05, sampling='iid',):
         vars = ['path_priority', 'path_sample', 'path_survey', 'path_ignore', 'verbose', 'outdir', 
                 'iter', 'progress', 'instrument', 'notebook', 'time_lower', 'time_upper', 'overhead', 
-                'hours', 'nights', 'archival', 'save']
+                'hours', 'nights', 'archival', 'save', 'workers', 'seed', 'bundle', 'converge', 'tol', 'sampling']
         if not notebook:
             vals = [os.path.join(args.inpdir, priority_fn), os.path.join(args.inpdir, sample_fn), 
                     os.path.join(args.inpdir, survey_fn), os.path.join(args.inpdir, ignore_fn), 
                     args.verbose, args.outdir, args.iter, args.progress, args.instrument,
-                    args.notebook, args.time_lower*60., args.time_upper*60., args.overhead*60., 
-                    args.hours, args.nights, args.archival, args.save]
+                    args.notebook, *[None if value is None else value*60. for value in (args.time_lower, args.time_upper, args.overhead)], 
+                    args.hours, args.nights, args.archival, args.save, args.workers, args.seed, args.bundle,
+                    args.converge, args.tol, args.sampling]
         else:
             _ROOT = os.path.abspath(os.getcwd())
             path_priority = os.path.join(_ROOT, inpdir, priority_fn)
@@ -67,18 +104,20 @@ class Survey:
             path_ignore = os.path.join(_ROOT, inpdir, ignore_fn)
             vals = [path_priority, path_sample, path_survey, path_ignore, verbose, outdir, iter, 
                     progress, instrument, notebook, time_lower*60., time_upper*60., overhead*60., 
-                    hours, nights, archival, save]
+                    hours, nights, archival, save, workers, seed, bundle, converge, tol, sampling]
         self.params = dict(zip(vars,vals))
+        self.verbose, self.save, self.outdir = self.params['verbose'], self.params['save'], self.params['outdir']
+        self.iter, self.progress, self.path_sample = self.params['iter'], self.params['progress'], self.params['path_sample']
         self.inst = args.instrument
         self.instrument = Instrument(self)
-        print(self.instrument)
+        self.instruments = {self.instrument.name.lower():self.instrument}
+        self.shared, self.writer, self.bundle, self.rankings = None, None, None, None
         self.track = {}
-        for n in np.arange(1,args.iter+1):
-            self.track[n] = {}
         if self.params['verbose']:
             print('\n ------------------------------\n -- prioritization  starting --\n ------------------------------\n\n   - loading sample and survey science information')
         self.get_sample()
         self.get_programs()
+        self.get_costs()
         self.get_seeds()
         if args.iter > 1:
             self.emcee = True
@@ -86,8 +125,10 @@ class Survey:
                 self.pbar = tqdm(total=self.iter)
         else:
             self.emcee = False
-        self.candidates = self.sample.copy()
+        self.state = self.get_state()
+        self.candidates = CandidateView(self.sample, self.state)
         self.sciences = self.programs.copy()
+        self.costs = self.raw_costs
 
 
     def get_sample(self, dec=-30., ruwe=2.):
@@ -108,12 +149,15 @@ class Survey:
 
         """
         # Load in sample to select from
+        self.programs = pd.read_csv(self.params['path_survey'], comment="#").programs.values.tolist()
         sample = pd.read_csv(self.params['path_sample'])
         self.sample = sample.query("dec > %f and ruwe < %f"%(dec, ruwe))
         self.remove_bad()
         self.add_columns()
         # science-case-specific metrics
         self.get_sc3_info()
+        self.sample.reset_index(drop=True, inplace=True)
+        self.index = TargetIndex(self.sample)
         self.get_counts()
         
 
@@ -140,7 +184,7 @@ class Survey:
         Adds in additional columns that might be relevant for the target selection.
 
         """
-        cols += ["in_%s"%program for program in self.programs]
+        cols = cols + ["in_%s"%program for program in self.programs]
         for col in cols:
             if col == 'npl':
                 self.sample[col] = self.sample.groupby('tic')['tic'].transform('count')
@@ -178,9 +222,15 @@ class Survey:
         ----------
         programs : pandas.DataFrame
             **very important** dataframe containing all survey program information
+        filters : filters.FilterCompiler
+            the compiled program filters
+        specs : Dict[str,observing.MethodSpec]
+            the parsed (and validated) observing method of every program
 
         """
         high_priority, no_no = [], []
+        self.filters = FilterCompiler(CandidateView(self.sample))
+        self.specs = {}
         # Get survey programs
         programs = pd.read_csv(self.params['path_survey'], comment="#")
         programs.set_index('programs', inplace=True, drop=False)
@@ -190,6 +240,11 @@ class Survey:
             priority = pd.read_csv(self.params['path_priority'])
         # Save individual program information
         for program in programs.index.values.tolist():
+            # parse the observing method once
+            try:
+                self.specs[program] = parse_method(programs.loc[program,'method'])
+            except ValueError as error:
+                raise ValueError("program %s: %s"%(program, error))
             # get initial allocation
             programs.loc[program,'total_time'] = (programs.loc[program,'allocations']/(np.sum(programs.allocations)))*self.params['nights']*self.params['hours']
             if not np.isnan(programs.loc[program,'remaining_hours']):
@@ -200,13 +255,17 @@ class Survey:
                 high_priority = [float(target) for target in priority[program].values if target != '-']
             if self.params['path_ignore'] is not None:
                 no_no = [float(target) for target in nono[program].values if target != '-']
+            if not isinstance(programs.loc[program,'filter'], str) or not programs.loc[program,'filter'].strip():
+                programs.loc[program,'filter'] = 'True'
             if (high_priority + no_no) != []:
+                programs.loc[program,'filter'] = '(%s)'%programs.loc[program,'filter']
                 for toi in (high_priority + no_no):
                     programs.loc[program,'filter'] += " and toi != %.2f"%toi
+            self.filters.compile(program, programs.loc[program,'filter'])
             if programs.loc[program,'n_maximum'] != -1:
                 programs.loc[program,'n_targets_left'] = programs.loc[program,'n_maximum']
             else:
-                query = self.sample.query(programs.loc[program,'filter'])
+                query = self.sample[self.filters.mask(program)]
                 targets = query.toi.values.tolist() + high_priority
                 targets = [int(np.floor(each)) for each in targets]
                 programs.loc[program,'n_targets_left'] = len(list(set(targets)))
@@ -237,6 +296,75 @@ class Survey:
         self.programs = programs.copy()
 
 
+    def get_costs(self):
+        """
+        Precomputes the raw cost (i.e. not yet shared with other programs) of every target 
+        in the sample for every program in the survey. Raw costs only depend on a target's
+        (static) properties and the program's observing method, so the matrix is built once 
+        here and is never updated during the selection process.
+        Every program is costed on the instrument of its observing method (i.e. the method's
+        first token, see `get_instrument`). Targets are shared (i.e. their costs split) between
+        all programs that selected them, also across instruments, where a shared target is
+        charged its largest per-instrument cost (see `sample.get_actual_costs`).
+
+        Attributes
+        ----------
+        raw_costs : numpy.ndarray
+            target x program matrix of raw costs (in seconds) -> this is not updated, this is preserved
+        program_ids : Dict[str,int]
+            maps each program to its column in the cost matrix
+        methods : Dict[observing.MethodSpec,List[int]]
+            maps each (unique) observing method to the columns of the programs that use it
+
+        """
+        self.program_ids = {program:j for j, program in enumerate(self.programs.index.values.tolist())}
+        self.methods = {}
+        for program, j in self.program_ids.items():
+            self.methods.setdefault(self.specs[program], []).append(j)
+        teff, vmag, template, nobs = self.sample['teff'].values, self.sample['vmag'].values, self.sample['template'].values, self.sample['nobs'].values
+        self.raw_costs = self.cost_matrix(teff, vmag, template, nobs)
+
+
+    def get_instrument(self, method):
+        """
+        Returns the cost engine of the instrument of an observing method (i.e. the method's
+        first token, e.g. 'hires' for 'hires-nobs=60-counts=ramp'), which is only created
+        once per instrument.
+
+        Parameters
+        ----------
+        method : Union[str,observing.MethodSpec]
+            observing method of a program
+
+        Returns
+        -------
+        instrument : observing.Instrument
+            the cost engine of the method's instrument
+
+        """
+        name = parse_method(method).instrument
+        if name not in self.instruments:
+            self.instruments[name] = Instrument(self, name=name)
+        return self.instruments[name]
+
+
+    def cost_matrix(self, teff, vmag, template, nobs):
+        """
+        Computes the raw costs of targets for every program, where every unique observing 
+        method is only costed once (i.e. batched per instrument and method).
+
+        Returns
+        -------
+        costs : numpy.ndarray
+            target x program matrix of raw costs (in seconds)
+
+        """
+        costs = np.zeros((len(teff), len(self.program_ids)))
+        for method, columns in self.methods.items():
+            costs[:,columns] = self.get_instrument(method).cost_function(teff, vmag, method, template=template, nobs=nobs)[:,None]
+        return costs
+
+
     # science-case-specific functions
     def get_sc3_info(self, include_qlp=True, mask=None):
         """
@@ -331,11 +459,143 @@ class Survey:
 
     def get_seeds(self):
         """
-        Ensures reproducibility due to the instrinsic randomness of the algorithm.
+        Ensures reproducibility due to the instrinsic randomness of the algorithm. 
+        Every MC iteration gets its own (statistically independent) seed, which 
+        is spawned from a single root seed (via args.seed).
+
+        Attributes
+        ----------
+        seed : numpy.random.SeedSequence
+            the root seed sequence
+        seeds : List[numpy.random.SeedSequence]
+            seed sequence of each iteration
+        sobol : Optional[streams.SobolSequence]
+            the scrambled Sobol' sequence of the root seed (only for args.sampling='sobol')
+
+        """
+        self.seed = np.random.SeedSequence(self.params['seed'])
+        self.seeds = self.seed.spawn(self.iter)
+        self.sobol = SobolSequence(self.seed) if self.params['sampling'] == 'sobol' else None
+
+
+    def __getstate__(self):
+        # the progress bar and data writer (and bundle) stay with the parent process (i.e. are not sent to MC workers)
+        state = self.__dict__.copy()
+        state.pop('pbar', None)
+        state.pop('writer', None)
+        state.pop('bundle', None)
+        if self.shared is not None:
+            # read-only arrays are sent by reference and the per-iteration state is rebuilt by reset_track
+            state['raw_costs'] = None
+            for key in ['candidates', 'costs', 'state', 'queues', 'sampler']:
+                state.pop(key, None)
+        return state
+
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if self.shared is not None:
+            self.raw_costs = self.shared.get('raw_costs')
+
+
+    def share(self):
+        """
+        Moves the read-only sample, raw cost matrix and static filter masks into shared 
+        memory (see `shared.SharedSample`), so that MC worker processes attach to them 
+        instead of each receiving (and holding) their own copy. Workers then only hold 
+        their per-iteration state (i.e. the selection state, the filter masks that depend
+        on it, the program queues and the track).
+
+        """
+        self.shared = SharedSample(self.sample, arrays={'raw_costs':self.raw_costs})
+        self.sample, self.raw_costs = self.shared, self.shared.get('raw_costs')
+        self.costs = self.raw_costs
+        self.filters.share(self.shared, columns=self.get_selection_columns())
+        self.rebind()
+
+
+    def unshare(self):
+        """
+        Copies the shared arrays back into (private) memory and frees the shared memory.
+
+        """
+        if self.shared is None:
+            return
+        self.sample, self.raw_costs = self.shared.copy(), self.raw_costs.copy()
+        self.costs = self.raw_costs
+        self.filters.unshare()
+        self.rebind()
+        self.shared.close()
+        self.shared = None
+
+
+    def rebind(self):
+        """
+        Rebinds the survey.candidates view (and the program filters) to the current survey 
+        sample, i.e. after it was moved into (or out of) shared memory.
+
+        """
+        self.candidates = CandidateView(self.sample, self.state)
+        self.filters.update(self.candidates, columns=[])
+
+
+    def get_results(self):
+        """
+        Collects the results of the current iteration (i.e. survey.n), which is what
+        an MC worker process sends back to the parent process. The iteration's track is
+        removed from the survey, so that a worker only ever holds its current iteration.
+
+        Returns
+        -------
+        results : dict
+            the iteration's track and selection state (survey.state), which holds the updated selection columns of the sample
+
+        """
+        return {'track':self.track.pop(self.n), 'state':self.state}
+
+
+    def set_results(self, n, results):
+        """
+        Merges the results of the nth iteration (see `get_results`) back into the survey.
+
+        Parameters
+        ----------
+        n : int
+            iteration number
+        results : dict
+            the iteration's results
+
+        """
+        self.n = n
+        self.track[n] = results['track']
+        self.state = results['state']
+        self.candidates = CandidateView(self.sample, self.state)
+
+
+    def get_sciences(self):
+        """
+        Rebuilds the survey programs dataframe (survey.sciences) from the selection state,
+        which is only needed for the data products (see `utils.make_data_products`).
+
+        """
+        self.sciences = self.state.to_frame(self.programs)
+
+
+    def get_state(self):
+        """
+        Creates the selection state from the initial conditions, i.e. the survey programs 
+        and the selection columns of the survey sample.
+
+        Returns
+        -------
+        state : state.SelectionState
+            the initial selection state
 
         """
-        self.seeds = [2222, 5531, 5348, 9632, 3755, 3401, 1061, 9307, 2033, 2114, 3103, 8120, 5442, 9179, 3165, 6114, 8757, 8574, 8078, 7724, 9056, 9066, 8423, 5278, 663, 4542, 6448, 7261, 6999, 7212, 3832, 3199, 6444, 1704, 8872, 2743, 9163, 1293, 8458, 5782, 7144, 9339, 3961, 9127, 4105, 3209, 7662, 5592, 4672, 2365, 8214, 3725, 2088, 1234, 6984, 2756, 3962, 7279, 9686, 112, 8936, 8807, 4149, 2535, 1541, 1422, 7991, 6445, 4384, 570, 9719, 5834, 5372, 1376, 1192, 1499, 8653, 730, 5469, 7541, 6546, 4002, 5677, 9251, 5459, 630, 908, 9074, 2675, 9517, 1015, 5272, 6846, 6820, 4516, 5632, 5671, 2126, 4440, 9670, 7768, 1405, 5330, 1854, 3156, 6949, 1119, 5257, 2999, 4251, 9674, 5362, 5009, 7526, 8293, 4518, 8641, 1365, 2492, 5061, 4804, 2710, 8823, 6637, 9382, 7928, 9219, 7840, 895, 5647, 3966, 6452, 9027, 8673, 1006, 469, 5056, 42, 8067, 7571, 3304, 6795, 9131, 6327, 5781, 5336, 4484, 5137, 3231, 4465, 91, 5135, 3303, 1890, 7593, 359, 6051, 1236, 9967, 3149, 9913, 3114, 9267, 3049, 6089, 6439, 828, 8893, 7708, 6766, 2818, 8745, 8791, 3639, 461, 3917, 8917, 2863, 1865, 9410, 1851, 617, 7563, 915, 1773, 4997, 6121, 8540, 6358, 1630, 5468, 8585, 4959, 8115, 6337, 355, 1977, 4800, 6831, 932, 1028, 8232, 1381, 3260, 2937, 7031, 6310, 5348, 2172, 3321, 4422, 1195, 2021, 481, 731, 5566, 9719, 7468, 9499, 1326, 4071, 7660, 6583, 5067, 5693, 2933, 8679, 9988, 550, 2599, 5536, 3081, 4429, 3592, 8140, 1398, 1481, 6823, 9006, 9264, 6037, 95, 9807, 2768, 4792, 7417, 6095, 8049, 79, 5070, 1457, 3099, 736, 2332, 2228, 146, 3862, 2153, 7800, 8664, 625, 2393, 88, 780, 4266, 9412, 4973, 426, 7742, 4593, 408, 7296, 1981, 867, 7636, 2455, 3519, 3093, 882, 7396, 815, 7717, 4792, 3103, 2747, 290, 8302, 2124, 2516, 3170, 8224, 3693, 5721, 3599, 9778, 5903, 8544, 69, 7648, 4860, 212, 517, 3765, 1401, 8722, 1689, 3281, 3061, 9293, 4954, 4584, 3357, 6380, 5266, 8972, 5578, 9289, 859, 486, 3746, 7928, 7240, 2861, 7615, 651, 5633, 4687, 7439, 2572, 1999, 1476, 5806, 1966, 9249, 3439, 4559, 6899, 5633, 1973, 6469, 1636, 4922, 5059, 7772, 3907, 7410, 1822, 9659, 8230, 3643, 9106, 9524, 8971, 2887, 705, 4252, 6198, 1420, 9063, 5272, 9641, 195, 5217, 1819, 2286, 431, 5379, 26, 7690, 7241, 3735, 2987, 1490, 2807, 5059, 6556, 5921, 3949, 6128, 606, 7636, 1451, 4598, 2446, 9877, 635, 876, 9594, 1742, 5887, 5355, 365, 8197, 7919, 6969, 9736, 1703, 8703, 3358, 8321, 6817, 3617, 9069, 6406, 3938, 3077, 6166, 1546, 4393, 1026, 9479, 2568, 1787, 1434, 8390, 3844, 4028, 5643, 9291, 5072, 8022, 7260, 1209, 5579, 6860, 2871, 2662, 4769, 7361, 7427, 8737, 1608, 6613, 7941, 5619, 6949, 3217, 4204, 1439, 3439, 4521, 4761, 4089, 2066, 9623, 3076, 9230, 1503, 9896, 7110, 2152, 1291, 1339, 5088, 2959, 8092, 5381, 7283, 8831, 8448, 6775, 5414, 5871, 2728, 8828, 6320, 3294, 7953, 4157, 5654, 6890, 5134, 45, 6881, 4237, 9561, 913, 9990, 9667, 650, 1353, 2963, 3896, 4368, 8162, 5630, 5889, 9093, 5298, 17, 7958, 6417, 7574, 6461, 7446, 8398, 5486, 7742, 7503, 1740, 6987, 2238, 1159, 6552, 7968, 440, 1671, 7755, 9214, 1099, 7801, 4910, 878, 3278, 667, 1813, 7540, 2082, 3182, 5580, 3256, 9619, 5890, 8902, 9635, 2516, 864, 823, 9222, 6156, 5011, 7191, 4584, 4112, 9991, 110, 2361, 2709, 6469, 9592, 9668, 6788, 7505, 4174, 3119, 5693, 429, 6224, 3174, 6134, 6902, 9692, 2620, 1532, 7973, 5644, 6105, 2495, 1368, 9342, 3747, 9358, 1039, 311, 5382, 7309, 2482, 1889, 1162, 5620, 8439, 5487, 975, 4845, 4641, 7027, 747, 1016, 5728, 6175, 5252, 598, 4920, 5544, 6273, 9336, 8096, 8059, 2467, 1098, 72, 372, 737, 4500, 2736, 7458, 3742, 3156, 8420, 5311, 8532, 7186, 9113, 7041, 6658, 2370, 2733, 8258, 139, 6127, 4489, 692, 5627, 8139, 9744, 9773, 3674, 9103, 9896, 897, 2939, 8342, 3031, 4991, 3110, 3845, 2214, 5184, 7482, 3367, 5030, 9570, 7613, 1394, 1491, 2570, 5573, 9688, 2731, 8333, 6764, 4922, 4886, 8623, 2301, 8688, 9286, 832, 439, 2502, 8934, 5356, 6584, 6322, 6958, 1542, 9526, 9040, 10000, 8659, 1672, 610, 4050, 6616, 7105, 6073, 9004, 5102, 7781, 1615, 8225, 2511, 3862, 6110, 9382, 5402, 1501, 1972, 6596, 2496, 2523, 2710, 3515, 4024, 7273, 6509, 1913, 8888, 5892, 6173, 1836, 7008, 1328, 6628, 6840, 126, 3190, 4511, 5644, 8944, 6386, 8863, 5022, 5361, 3799, 6701, 750, 785, 2069, 6609, 6429, 7252, 5477, 2309, 9163, 7957, 4056, 8866, 6815, 8583, 2891, 6979, 1242, 3795, 4564, 1785, 1292, 3009, 8132, 3837, 5357, 5549, 9030, 9177, 7603, 3764, 347, 3695, 3836, 7269, 1196, 5401, 4362, 4053, 9416, 2994, 6420, 8527, 7178, 1084, 1582, 967, 7636, 3565, 6510, 4259, 6769, 7106, 1102, 2072, 5721, 4149, 1459, 4861, 39, 1404, 44, 7296, 3745, 2023, 3162, 4885, 9147, 2716, 4395, 9489, 9240, 9882, 3761, 2755, 1862, 9856, 404, 7118, 8258, 5581, 1477, 4694, 463, 598, 9566, 9119, 6289, 5209, 6703, 4719, 8622, 9687, 8361, 5639, 812, 6559, 9332, 6663, 5722, 3930, 8141, 6207, 7787, 1572, 6012, 6052, 609, 6106, 606, 3013, 3915, 6504, 7301, 5596, 1644, 4915, 5623, 943, 1779, 1028, 5734, 8674, 6440, 5126, 5988, 4179, 2955, 9198, 4068, 7912, 6211, 8559, 7260, 193, 7662, 8317, 7231, 181, 1482, 9115, 9971, 4519, 4073, 4300, 2938, 5456, 2939, 3906, 6385, 5011, 9510, 1227, 8649, 4715, 6021, 5418, 3568, 3571, 622, 5414, 1137, 5375, 6263, 4930, 2352, 8565, 6277, 563, 1113, 4847, 1355, 3215, 5297, 8883, 8371, 6917, 5952, 3448, 6154, 52, 2204, 763, 919, 7355, 2095, 8809, 2362, 7590, 5591, 4950, 2817, 7882, 9214, 7549, 5118, 1046, 2298, 7458, 8277, 339, 2443, 8941, 2072, 324, 1350, 5502, 2501, 2680, 5925, 9935, 6294, 5578, 6686, 5888, 5921, 2690, 8177, 2405, 5438, 6754, 2331, 5550, 1591, 9183, 3714, 1097, 7171, 1552, 117, 1135, 1067, 4952, 6742, 3960, 1489, 4201, 2390, 7777, 979, 2114, 9652, 7569, 5795, 4386, 7838, 6684, 1262, 7700, 8091, 1979, 3566, 6058, 5834, 5443, 50, 1658, 6047, 4273, 9477, 3761, 5953, 2732, 7142, 81, 4457, 4703, 5029, 9303, 1936, 468, 5888, 7253, 6611, 1883, 8285, 7267, 2028, 2842, 9302, 4262, 812, 2696, 9879, 2992, 4865, 5031, 6292, 2439, 2261, 8345, 9926, 8960, 2960, 4199]
- 
+        sample = CandidateView(self.sample)
+        members = np.column_stack([sample['in_%s'%program] for program in self.program_ids]).astype(np.uint8)
+        return SelectionState(self.programs, members, sample['nobs_goal'], sample['priority'], sample['in_other_programs'])
+
 
     def reset_track(self):
         """
@@ -345,52 +605,81 @@ class Survey:
         new survey.track to log the new selection process to.
 
         """
-        # make copies of the original dataframes, thus resetting the information
-        self.candidates = self.sample.copy()
-        self.sciences = self.programs.copy()
-        self.track[self.n][0] = {}
-        for program, hours in zip(self.sciences.index.values.tolist(), self.sciences.remaining_hours.values.tolist()):
-            self.track[self.n][0][program] = round(hours,3)
-        self.track[self.n][0]['total_time'] = round(np.sum(self.sciences.remaining_hours.values.tolist()),3)
-        self.track[self.n][0]['program'] = '--'
-        self.track[self.n][0]['program_pick'] = 0
-        self.track[self.n][0]['overall_priority'] = 0
-        self.track[self.n][0]['toi'] = 0
-        self.track[self.n][0]['tic'] = 0
+        # a new selection state, thus resetting the information (the sample and costs are read-only)
+        self.costs = self.raw_costs
+        self.state = self.get_state()
+        self.candidates = CandidateView(self.sample, self.state)
+        self.filters.update(self.candidates, columns=self.get_selection_columns())
+        self.track[self.n] = TrackBuffer(self.state.programs)
+        self.track[self.n].append()
+        self.track[self.n].set_hours(0, self.state.remaining_hours)
+        self.queues = {program:ProgramQueue(self, program) for program in self.state.programs}
+        self.exhausted, self.dirty = set(), set()
+        self.sampler = ProgramSampler(np.zeros(len(self.state.programs)))
+        self.update_weights(self.state.programs)
         self.priority = 1
         self.i = 1
-        np.random.seed(self.get_seeds[self.n-1])
+        if self.params['sampling'] == 'sobol' and (self.sobol is None or self.sobol.root is not self.seed):
+            self.sobol = SobolSequence(self.seed)
+        self.rng = DrawStream(self.seeds, self.n, scheme=self.params['sampling'], root=self.seed, sobol=self.sobol)
 
 
-    def pick_program(self):
+    def pick_program(self, rng=None):
         """
         Given a set of programs, selects a program randomly based on the proportional time remaining 
-        for each program in a Survey. This is done by creating a cumulative distribution function (CDF) 
-        using all programs "remaining_hours", normalizing by the total remaining time (Ttot), then draws 
-        a random number from U~[0,1), which then maps back to the list of programs.
+        for each program in a Survey. The program weights (i.e. their "remaining_hours") are kept in 
+        a weighted sampler (see `update_weights`), which draws a random number from U~[0,1) that then
+        maps back to the list of programs. Programs without targets or time left are never drawn, so
+        every pick uses exactly one random number.
 
         Parameters
         ----------
-        programs : dict
-            program dictionary of Survey object (must have 'remaining_hours' as a key for each program)
+        rng : Optional[Union[streams.DrawStream,numpy.random.Generator]]
+            random numbers of the current iteration (default is survey.rng, see `reset_track`)
 
-        Returns
-        -------
-        program : str
-            the selected program which comes directly from the input programs dict keys
+        Attributes
+        ----------
+        program : Optional[str]
+            the selected program which comes directly from the survey.programs index, which is `None` 
+            if no program can make a selection
+
+        """
+        if rng is None:
+            rng = self.rng
+        pick = rng.random()
+        i = self.sampler.draw(pick)
+        if i is None:
+            self.program = None
+        else:
+            self.program = self.state.programs[i]
+
+
+    def update_weights(self, programs):
+        """
+        Updates the weights of the given programs in the program sampler. Programs that have no 
+        targets left (or are exhausted) or no remaining hours are removed from the draw.
+
+        Parameters
+        ----------
+        programs : List[str]
+            the programs to update
 
         """
-        while True:
-            cdf = list(np.cumsum(self.sciences.remaining_hours.values.tolist())/np.sum(self.sciences.remaining_hours.values.tolist()))
-            cdf.insert(0, 0.)
-            pick = np.random.random()
-            for i in range(len(cdf)-1):
-                if cdf[i] < pick and cdf[i+1] > pick:
-                    break
-            program = self.sciences.index.values.tolist()[i]
-            if self.sciences.loc[program,'n_targets_left']:
-                self.program = program
-                break
+        for program in programs:
+            j = self.program_ids[program]
+            weight = self.state.remaining_hours[j]
+            if program in self.exhausted or self.state.n_targets_left[j] <= 0:
+                weight = 0.
+            self.sampler.update(j, weight)
+
+
+    def exhaust(self):
+        """
+        Removes the selected program from the draw, e.g. when it has no targets left to select.
+
+        """
+        self.exhausted.add(self.program)
+        self.update_weights([self.program])
 
 
     def update(self, sample):
@@ -405,40 +694,60 @@ class Survey:
         4)  after crediting/debiting all relevant programs, the remaining hours in all programs
             in the survey is logged in the survey.track, along with the overall priority of the
             selected target in the survey as well as the internal program priority
+        5)  the rows that changed (i.e. survey.dirty) are re-evaluated by the program filters and
+            re-positioned in the program queues, so the work per pick only scales with what changed
 
         """
+        idx = self.index.get_rows(sample.pick.tic)
+        j = self.program_ids[self.program]
         self.add_program_pick(sample.pick)
-        self.sciences.loc[self.program,'n_targets_left'] -= 1
-        self.sciences.loc[self.program,'pick_number'] += 1
+        self.state.n_targets_left[j] -= 1
+        self.state.pick_number[j] += 1
         self.update_goals(sample.pick)
         if not int(sample.pick.in_other_programs):
-            net = {self.program:-1.*(float(pick.actual_cost)/3600.)}
-            self.track[self.n][self.i]['overall_priority'] = self.priority
-            self.candidates.loc[self.candidates['tic'] == int(pick.tic),'priority'] = int(self.priority)
+            net = {self.program:-1.*(float(sample.pick.actual_cost)/3600.)}
+            self.track[self.n].overall_priority[self.i] = self.priority
+            self.state.priority[idx] = self.priority
+            self.dirty.update(idx)
             self.priority += 1
         else:
             net = sample.get_net_costs()
-            idx = self.candidates.loc[self.candidates['tic'] == int(sample.pick.tic)].index.values.tolist()[0]
-            self.track[self.n][self.i]['overall_priority'] = int(self.candidates.loc[idx,'priority'])
+            self.track[self.n].overall_priority[self.i] = int(self.state.priority[idx[0]])
         for key in net.keys():
-            self.sciences.loc[key,'remaining_hours'] += net[key]
+            self.state.remaining_hours[self.program_ids[key]] += net[key]
+        self.update_weights(list(set(net.keys()) | {self.program}))
         self.update_program_hours()
-        self.candidates.loc[self.candidates['tic'] == int(pick.tic),'in_%s'%self.program] = 1
-        self.update_targets()
+        self.update_targets(idx)
+        rows, self.dirty = sorted(self.dirty), set()
+        if rows:
+            self.filters.update(self.candidates, columns=self.get_selection_columns(), rows=rows)
+            for queue in self.queues.values():
+                queue.update(rows)
         self.i += 1
 
 
+    def get_selection_columns(self):
+        """
+        Columns of the survey sample (via survey.candidates) that are updated during
+        the selection process, and therefore any filters that depend on them.
+
+        Returns
+        -------
+        columns : List[str]
+            the selection-dependent columns
+
+        """
+        return ['nobs_goal', 'priority', 'in_other_programs'] + ['in_%s'%program for program in self.programs.index.values.tolist()]
+
+
     def add_program_pick(self, pick):
         """
         Updates the survey.track with the new selection, including the program, the internal
         program priority (or pick number), the selected target's TOI and TIC.
 
         """
-        self.track[self.n][self.i] = {}
-        self.track[self.n][self.i]['program'] = self.program
-        self.track[self.n][self.i]['program_pick'] = self.sciences.loc[self.program,'pick_number']+1
-        self.track[self.n][self.i]['toi'] = float(pick.toi)
-        self.track[self.n][self.i]['tic'] = int(pick.tic)
+        j = self.program_ids[self.program]
+        self.track[self.n].append(j, self.state.pick_number[j]+1, float(pick.toi), int(pick.tic))
 
 
     def update_goals(self, pick):
@@ -462,12 +771,11 @@ class Survey:
         survey : survey.Survey
         class object with updated nobs_goal information, if applicable
         """
-        method = self.sciences.loc[self.program, "method"]
-        nobs_goal = int(float((method.split('-')[1]).split('=')[-1]))
-        idx = self.candidates.loc[self.candidates['tic'] == int(pick.tic)].index.values.tolist()
-        if nobs_goal > self.candidates.loc[idx[0], 'nobs_goal']:
-            for index in idx:
-                self.candidates.loc[index, 'nobs_goal'] = nobs_goal
+        nobs_goal = self.specs[self.program].nobs
+        idx = self.index.get_rows(pick.tic)
+        if nobs_goal > self.state.nobs_goal[idx[0]]:
+            self.state.nobs_goal[idx] = nobs_goal
+            self.dirty.update(idx)
 
 
     def update_program_hours(self):
@@ -476,18 +784,24 @@ class Survey:
         after any credits or debits were made in the single iteration (transaction).
 
         """
-        for program, hours in zip(self.sciences.index.values.tolist(), self.sciences.remaining_hours.values.tolist()):
-            self.track[self.n][self.i][program] = round(hours,3)
-        self.track[self.n][self.i]['total_time'] = round(np.sum(self.sciences.remaining_hours.values.tolist()),3)
+        self.track[self.n].set_hours(self.i, self.state.remaining_hours)
 
 
-    def update_targets(self):
+    def update_targets(self, idx):
         """
-        Updates the survey sample (via survey.candidates), which counts the number of programs 
-        a given target was selected by.
+        Updates the membership matrix and the number of programs a given target was selected
+        by (via survey.state) with the new selection. Since a selection only changes the 
+        memberships of a single star, only the star's rows are updated.
+
+        Parameters
+        ----------
+        idx : List[int]
+            rows of the selected star
 
         """
-        start = np.array([0]*len(self.candidates))
-        for science in self.sciences.index.values.tolist():
-            start += self.candidates['in_%s'%science].values.tolist()
-        self.candidates['in_other_programs'] = start
\ No newline at end of file
+        j = self.program_ids[self.program]
+        new = [row for row in idx if not self.state.members[row,j]]
+        if new:
+            self.state.members[new,j] = 1
+            self.state.in_other_programs[new] += 1
+            self.dirty.update(new)
\ No newline at end of file
@@ -0,0 +1,163 @@
+import os
+import json
+import hashlib
+import numpy as np
+from scipy.interpolate import RegularGridInterpolator
+
+
+
+
+class LookupTable:
+    """
+    Precomputed table of a (smooth) function over a regular grid, which is stored as a
+    memory-mapped `.npy` file with a `.json` sidecar holding the grid axes and the hash
+    of the inputs it was built from (see `get_table`). Queries are answered by multilinear
+    interpolation and only read the pages of the table they need, so loading a table is
+    instant regardless of its size.
+
+    Parameters
+    ----------
+    axes : List[numpy.ndarray]
+        the (ascending) grid axes
+    values : numpy.ndarray
+        the tabulated values, with one dimension per axis
+    digest : str
+        hash of the inputs the table was built from
+    info : Optional[dict]
+        any other (json serializable) information needed to use the table
+
+    """
+
+    def __init__(self, axes, values, digest='', info=None):
+        self.axes = [np.asarray(axis, dtype=float) for axis in axes]
+        self.values, self.digest = values, digest
+        self.info = {} if info is None else dict(info)
+        self.interpolator = RegularGridInterpolator(self.axes, self.values, bounds_error=False, fill_value=np.nan)
+
+
+    def __call__(self, *points):
+        """
+        Interpolates the table at the given points (one array per axis), where points
+        outside the grid are `nan`.
+
+        """
+        points = np.broadcast_arrays(*[np.atleast_1d(np.asarray(point, dtype=float)) for point in points])
+        return self.interpolator(np.stack(points, axis=-1))
+
+
+    def contains(self, *points):
+        """
+        Checks which points (one array per axis) lie within the grid.
+
+        """
+        inside = True
+        for axis, point in zip(self.axes, points):
+            inside = inside & (point >= axis[0]) & (point <= axis[-1])
+        return np.atleast_1d(inside)
+
+
+    def save(self, path):
+        """
+        Saves the table to '<path>.npy' and its axes, hash and information to '<path>.json'.
+        Both files are written to temporary files first, so that other processes never
+        read a partially written table.
+
+        """
+        with open('%s.npy.tmp'%path, 'wb') as f:
+            np.save(f, np.asarray(self.values), allow_pickle=False)
+        with open('%s.json.tmp'%path, 'w') as f:
+            json.dump({'digest':self.digest, 'axes':[axis.tolist() for axis in self.axes], 'info':self.info}, f)
+        os.replace('%s.npy.tmp'%path, '%s.npy'%path)
+        os.replace('%s.json.tmp'%path, '%s.json'%path)
+
+
+    @classmethod
+    def load(cls, path, digest=None):
+        """
+        Memory maps a saved table, which is `None` if it does not exist or was built
+        from different inputs (i.e. its hash does not match).
+
+        """
+        if not os.path.exists('%s.npy'%path) or not os.path.exists('%s.json'%path):
+            return None
+        with open('%s.json'%path) as f:
+            info = json.load(f)
+        if digest is not None and info['digest'] != digest:
+            return None
+        return cls(info['axes'], np.load('%s.npy'%path, mmap_mode='r'), digest=info['digest'], info=info.get('info'))
+
+
+def get_digest(files, **options):
+    """
+    Hashes the contents of the source files (and the options) a table is built from.
+
+    """
+    digest = hashlib.sha256(json.dumps(options, sort_keys=True).encode())
+    for file in files:
+        with open(file, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+
+def get_table(path, build, files, **options):
+    """
+    Loads a lookup table, which is (re)built if the table does not exist yet or its
+    source files (or options) changed. If the table cannot be saved (e.g. a read-only
+    directory), it is only kept in memory.
+
+    Parameters
+    ----------
+    path : str
+        path of the table, without the extension
+    build : Callable
+        builds the table (i.e. returns a `tables.LookupTable`), which is only called when the table is (re)built
+    files : List[str]
+        the source files of the table
+    **options : dict
+        any other inputs of the table (e.g. the wavelength), which are part of the hash
+
+    Returns
+    -------
+    table : tables.LookupTable
+        the (memory-mapped) table
+
+    """
+    digest = get_digest(files, **options)
+    table = LookupTable.load(path, digest=digest)
+    if table is not None:
+        return table
+    table = build()
+    table.digest = digest
+    try:
+        table.save(path)
+    except OSError:
+        return table
+    return LookupTable.load(path, digest=digest)
+
+
+def tabulate(function, axes, chunk=16384):
+    """
+    Evaluates a vectorized function at every point of a regular grid (in chunks, to
+    limit the memory of the function).
+
+    Parameters
+    ----------
+    function : Callable
+        vectorized function, which is given one (flattened) array per axis
+    axes : List[numpy.ndarray]
+        the grid axes
+    chunk : int
+        number of grid points per function call (default is `16384`)
+
+    Returns
+    -------
+    values : numpy.ndarray
+        the function over the grid, with one dimension per axis
+
+    """
+    points = [point.ravel() for point in np.meshgrid(*axes, indexing='ij')]
+    values = np.empty(len(points[0]))
+    for i in range(0, len(values), chunk):
+        values[i:i+chunk] = function(*[point[i:i+chunk] for point in points])
+    return values.reshape([len(axis) for axis in axes])
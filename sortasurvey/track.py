@@ -0,0 +1,167 @@
+import numpy as np
+import pandas as pd
+
+
+
+
+class TrackBuffer:
+    """
+    Columnar log of every step of a single selection process (i.e. the survey.track of an
+    iteration). Every column is a preallocated array that doubles in size when it is full,
+    so logging a step does not create any Python objects. Programs are stored by their
+    integer id (`-1` for the initial conditions) and the remaining hours of every program are
+    logged as a steps x programs matrix, rounded to 3 decimals (as in ranking_steps.csv).
+
+    Parameters
+    ----------
+    programs : List[str]
+        the program names, in order of their ids
+    size : int
+        initial number of steps to allocate (default is `256`)
+
+    Attributes
+    ----------
+    n : int
+        number of logged steps
+    program : numpy.ndarray
+        (int32) id of the program that made the selection
+    program_pick : numpy.ndarray
+        (int32) internal program priority (or pick number) of the selection
+    overall_priority : numpy.ndarray
+        (int32) overall priority of the selection
+    tic : numpy.ndarray
+        (int64) TIC of the selection
+    toi : numpy.ndarray
+        (float64) TOI of the selection
+    hours : numpy.ndarray
+        (float32) remaining hours of each program after the selection
+    total_time : numpy.ndarray
+        (float64) total remaining hours after the selection
+
+    """
+
+    columns = ['program', 'program_pick', 'overall_priority', 'tic', 'toi']
+
+    def __init__(self, programs, size=256):
+        self.programs = list(programs)
+        self.n = 0
+        self.program = np.zeros(size, dtype='int32')
+        self.program_pick = np.zeros(size, dtype='int32')
+        self.overall_priority = np.zeros(size, dtype='int32')
+        self.tic = np.zeros(size, dtype='int64')
+        self.toi = np.zeros(size, dtype='float64')
+        self.hours = np.zeros((size, len(self.programs)), dtype='float32')
+        self.total_time = np.zeros(size, dtype='float64')
+
+
+    def __len__(self):
+        return self.n
+
+
+    def __getstate__(self):
+        # only the logged steps are sent back from MC workers
+        state = self.__dict__.copy()
+        for column in self.columns + ['hours', 'total_time']:
+            state[column] = state[column][:self.n].copy()
+        return state
+
+
+    def append(self, program=-1, program_pick=0, toi=0., tic=0):
+        """
+        Logs a new step of the selection process.
+
+        Parameters
+        ----------
+        program : int
+            id of the program that made the selection (default is `-1`, i.e. the initial conditions)
+        program_pick : int
+            internal program priority (or pick number) of the selection
+        toi : float
+            TOI of the selection
+        tic : int
+            TIC of the selection
+
+        Returns
+        -------
+        i : int
+            the step number
+
+        """
+        if self.n == len(self.program):
+            self.grow()
+        i = self.n
+        self.program[i], self.program_pick[i], self.toi[i], self.tic[i] = program, program_pick, toi, tic
+        self.overall_priority[i] = 0
+        self.n += 1
+        return i
+
+
+    def grow(self):
+        """
+        Doubles the number of allocated steps.
+
+        """
+        for column in self.columns + ['hours', 'total_time']:
+            values = getattr(self, column)
+            new = np.zeros((max(2*len(values), 1),)+values.shape[1:], dtype=values.dtype)
+            new[:len(values)] = values
+            setattr(self, column, new)
+
+
+    def set_hours(self, i, hours):
+        """
+        Logs the remaining hours of every program (and their total) after the ith step.
+
+        Parameters
+        ----------
+        i : int
+            the step number
+        hours : numpy.ndarray
+            remaining hours of each program
+
+        """
+        hours = np.asarray(hours, dtype='float64').tolist()
+        self.hours[i] = [round(hour, 3) for hour in hours]
+        self.total_time[i] = round(np.sum(hours), 3)
+
+
+    def to_numpy(self):
+        """
+        Exports the logged steps as NumPy arrays.
+
+        Returns
+        -------
+        track : Dict[str,numpy.ndarray]
+            every column of the track (trimmed to the logged steps), where 'hours' is the steps x programs matrix
+
+        """
+        track = {column:getattr(self, column)[:self.n].copy() for column in self.columns + ['hours', 'total_time']}
+        track['programs'] = np.array(self.programs)
+        return track
+
+
+    def to_frame(self):
+        """
+        Exports the logged steps in the ranking_steps.csv layout, i.e. one row per step
+        with the program name, pick, priorities, TIC, TOI, the remaining hours of every
+        program and the total remaining hours.
+
+        Returns
+        -------
+        df : pandas.DataFrame
+            the track of the selection process
+
+        """
+        names = np.array(['--'] + self.programs, dtype=object)
+        data = {
+            'program':names[self.program[:self.n]+1],
+            'program_pick':self.program_pick[:self.n].astype('int64'),
+            'overall_priority':self.overall_priority[:self.n].astype('int64'),
+            'tic':self.tic[:self.n].copy(),
+            'toi':self.toi[:self.n].copy(),
+        }
+        hours = np.round(self.hours[:self.n].astype('float64'), 3)
+        for j, program in enumerate(self.programs):
+            data[program] = hours[:,j]
+        data['total_time'] = self.total_time[:self.n].copy()
+        return pd.DataFrame(data, columns=self.columns+self.programs+['total_time'])
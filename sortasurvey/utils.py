@@ -5,7 +5,10 @@ import pandas as pd
 pd.set_option('mode.chained_assignment', None)
 
 
-from sortasurvey import observing
+from sortasurvey.aggregate import RankingAggregator
+from sortasurvey.bundle import ResultBundle
+from sortasurvey.observing import MethodSpec
+from sortasurvey.writer import write_text
 
 
 def make_data_products(survey):
@@ -22,6 +25,7 @@ def make_data_products(survey):
 
 
     """
+    survey.get_sciences()
     if survey.emcee:
         if survey.verbose and survey.progress:
             survey.pbar.update(1)
@@ -33,22 +37,30 @@ def make_data_products(survey):
         if survey.verbose:
             print("   - algorithm took %d seconds to run"%(int(survey.ranking_time)))
 
+    if survey.emcee and survey.rankings is None:
+        survey.rankings = RankingAggregator(survey.programs.index.values.tolist())
     if survey.save:
         if not survey.emcee:
             survey = make_directory(survey)
         else:
             if survey.n == 1:
                 survey = make_directory(survey)
-            if not os.path.exists('%s/%d/'%(survey.path_save,survey.n)):
-                os.makedirs('%s/%d/'%(survey.path_save,survey.n))
-            else:
-                return
+                if survey.params['bundle']:
+                    survey.bundle = ResultBundle('%s/mc_results.npz'%survey.path_save)
+            if survey.bundle is None:
+                os.makedirs('%s/%d/'%(survey.path_save,survey.n), exist_ok=True)
         survey = make_final_sample(survey)
         survey = make_ranking_steps(survey)
         survey = assign_priorities(survey)
-#        survey = final_costs(survey)
+        survey = final_costs(survey)
         survey = program_overlap(survey)
         get_stats(survey)
+    elif survey.emcee:
+        # the prioritized list is still needed for the MC rankings (see `emcee_rankings`)
+        survey = make_ranking_steps(survey)
+        survey = assign_priorities(survey)
+    if survey.emcee:
+        survey.rankings.update(survey.observed)
 
 
 def make_directory(survey, i=1):
@@ -101,25 +113,25 @@ def make_final_sample(survey, special=["SC2A", "SC4", "SC2Bii"],
             if science == 'SC2A' or science == 'SC4':
             # SC2A+SC4 have different observing approaches than a majority of TKS programs
                 changes = survey.df.query('in_%s == 1 and in_other_programs == 1'%science)
-                method = survey.programs.loc[science, 'method']
-                for i in changes.index.values.tolist():
-                    df_temp = changes.loc[i]
-                    nobs_goal = int(float((method.split('-')[1]).split('=')[-1]))
-                    survey.df.loc[i, "nobs_goal"] = nobs_goal
-                    tottime = observing.cost_function(df_temp, method, include_archival=False)
-                    survey.df.loc[i, "tot_time"] = round(tottime/3600.,3)
-                    remaining_nobs = int(nobs_goal - survey.df.loc[i, "nobs"])
-                    if remaining_nobs < 0:
-                        remaining_nobs = 0
-                    survey.df.loc[i, "rem_nobs"] = remaining_nobs
-                    lefttime = observing.cost_function(df_temp, method)
-                    survey.df.loc[i, "rem_time"] = round(lefttime/3600.,3)
+                method = survey.specs[science]
+                idx = changes.index.values
+                nobs_goal = method.nobs
+                survey.df.loc[idx, "nobs_goal"] = nobs_goal
+                teff, vmag, template, nobs = changes['teff'].values, changes['vmag'].values, changes['template'].values, changes['nobs'].values
+                tottime = survey.get_instrument(method).cost_function(teff, vmag, method, template=template, nobs=nobs, archival=False)
+                survey.df.loc[idx, "tot_time"] = np.round(tottime/3600.,3)
+                survey.df.loc[idx, "rem_nobs"] = np.clip(np.trunc(nobs_goal - nobs), 0, None).astype(int)
+                lefttime = survey.get_instrument(method).cost_function(teff, vmag, method, template=template, nobs=nobs)
+                survey.df.loc[idx, "rem_time"] = np.round(lefttime/3600.,3)
             elif science == 'SC2Bii':
             # we need to also add in our RM targets
                 for target in survey.programs.loc['SC2Bii', 'high_priority']:
-                    survey.df.loc[survey.df['toi'] == target,'in_SC2Bii'] = 1
-                    if np.isnan(survey.df.loc[survey.df['toi'] == target, 'priority'].values.tolist()[0]):
-                        survey.df.loc[survey.df['toi'] == target, 'priority'] = survey.df['priority'].max()+1
+                    row = survey.index.get_row(target)
+                    if row is None:
+                        continue
+                    survey.df.loc[row,'in_SC2Bii'] = 1
+                    if np.isnan(survey.df.loc[row, 'priority']):
+                        survey.df.loc[row, 'priority'] = survey.df['priority'].max()+1
                 start = np.array([0]*len(survey.df))
                 for science in survey.programs.index.values.tolist():
                     start += survey.df['in_%s'%science].values.tolist()
@@ -135,7 +147,7 @@ def make_final_sample(survey, special=["SC2A", "SC4", "SC2Bii"],
         print('   - Making data products, including:')
     if survey.save:
         if survey.emcee:
-            survey.df.to_csv('%s/%d/TOIs_perfect_final.csv'%(survey.path_save, survey.n), index=False)
+            save(survey, 'TOIs_perfect_final', survey.df, index=False)
         else:
             survey.df.to_csv('%s/%s_final.csv'%(survey.path_save, (survey.path_sample.split('/')[-1]).split('.')[0]), index=False)
         if survey.verbose and not survey.emcee:
@@ -161,31 +173,32 @@ def make_ranking_steps(survey):
         updated Survey class object with the new 'ranking_steps' attribute
 
     """
-    reorder = get_columns('track', survey.sciences.name.values.tolist())
-    track = pd.DataFrame.from_dict(survey.track[survey.n], orient='index')
-    df = pd.DataFrame(columns = reorder)
-    for column in reorder:
-        df[column] = track[column]
-    tois = [int(target) for target in df.toi.values.tolist()]
-    idx = len(df)
-    for t, target in enumerate(survey.programs.loc['SC2Bii', 'high_priority']):
-        idx = len(df)
-        df.loc[idx+t,'program'] = 'SC2Bii'
-        df.loc[idx+t,'program_pick'] = t+1
-        df.loc[idx+t,'toi'] = target
-        df.loc[idx+t,'tic'] = survey.df[survey.df['toi'].isin([target])]['tic'].values.tolist()[0]
-        if int(np.floor(target)) not in tois:
-            df.loc[idx+t,'overall_priority'] = int(df['overall_priority'].max()+1)
-        else:
-            new=tois.index(int(np.floor(target)))
-            df.loc[idx+t,'overall_priority'] = df.loc[new,'overall_priority']
-            df.loc[idx+t,'tic'] = df.loc[new,'tic']
-        for program in survey.programs.index.values.tolist():
-            df.loc[idx+t,program] = df.loc[idx-1,program]
-        df.loc[idx+t,'total_time'] = df.loc[idx-1,'total_time']
+    df = survey.track[survey.n].to_frame()
+    targets = []
+    if 'SC2Bii' in survey.programs.index.values.tolist():
+        targets = survey.programs.loc['SC2Bii', 'high_priority']
+    if targets:
+        # RM targets are added as steps at the end, which either share the priority of
+        # the same star (if it was selected) or are prioritized after all other targets
+        tois = [int(target) for target in df.toi.values.tolist()]
+        priority, steps = int(df['overall_priority'].max()), []
+        for t, target in enumerate(targets):
+            if int(np.floor(target)) not in tois:
+                priority += 1
+                row = survey.index.get_row(target)
+                tic = survey.df['tic'].values[row] if row is not None else np.nan
+                steps.append(['SC2Bii', t+1, priority, tic, target])
+            else:
+                new = tois.index(int(np.floor(target)))
+                steps.append(['SC2Bii', t+1, df['overall_priority'].values[new], df['tic'].values[new], target])
+        steps = pd.DataFrame(steps, columns=df.columns.values.tolist()[:5], index=len(df)+2*np.arange(len(steps)))
+        for column in df.columns.values.tolist()[5:]:
+            steps[column] = df[column].values[-1]
+        # the step labels and (float) integer columns are kept consistent with earlier versions
+        df = pd.concat([df, steps]).astype({'program_pick':'float64', 'overall_priority':'float64', 'tic':'float64'})
     if survey.save:
         if survey.emcee:
-            df.to_csv('%s/%d/ranking_steps.csv'%(survey.path_save,survey.n))
+            save(survey, 'ranking_steps', df)
         else:
             df.to_csv('%s/ranking_steps.csv'%survey.path_save)
         if survey.verbose and not survey.emcee:
@@ -194,7 +207,7 @@ def make_ranking_steps(survey):
     return survey
     
     
-def assign_priorities(survey, obs={}, m=1):
+def assign_priorities(survey, m=1):
     """
     In summary, this transforms the ranking steps into a final prioritized list.
     This module takes all information from a single algorithm iteration i.e. a 
@@ -214,20 +227,16 @@ def assign_priorities(survey, obs={}, m=1):
 
     """
     track_sorted = survey.ranking_steps.sort_values(by = ['overall_priority'])
-    for q in list(set(track_sorted.overall_priority.values.tolist())):
-        if int(q) != 0:
-            prior = track_sorted[track_sorted["overall_priority"] == q]
-            obs[m] = {}
-            obs[m]['tic'] = int(prior.tic.values.tolist()[0])
-            obs[m]['toi'] = int(np.floor(prior.toi.values.tolist()[0]))
-            obs[m]['programs'] = prior.program.values.tolist()
-            m += 1
-    observed = pd.DataFrame.from_dict(obs, orient='index')
-    observed.reset_index(inplace = True)
-    observed = observed.rename(columns = {'index':'overall_priority'})
+    track_sorted = track_sorted[track_sorted['overall_priority'].values.astype(int) != 0]
+    first = track_sorted.drop_duplicates(subset='overall_priority')
+    programs = track_sorted.groupby('overall_priority', sort=True)['program'].agg(list)
+    observed = pd.DataFrame({'overall_priority':np.arange(m, m+len(first)), 
+                             'tic':first.tic.values.astype('int64'), 
+                             'toi':np.floor(first.toi.values).astype('int64'), 
+                             'programs':programs.values.tolist()})
     if survey.save:
         if survey.emcee:
-            observed.to_csv('%s/%d/observing_priorities.csv'%(survey.path_save,survey.n))
+            save(survey, 'observing_priorities', observed)
         else:
             observed.to_csv('%s/observing_priorities.csv'%survey.path_save, index = False)
         if survey.verbose and not survey.emcee:
@@ -236,12 +245,13 @@ def assign_priorities(survey, obs={}, m=1):
     return survey
 
         
-def final_costs(survey, costs={}):
+def final_costs(survey):
     """
     Computes the individual costs of all selected targets for a program, 
     which incorporates both existing archival data and shared costs. Think
     of this as an itemized receipt for all targets and all programs in a
-    survey.
+    survey. The costs of all targets are computed in a single (vectorized) 
+    pass per program, and are saved as 'total_costs.csv'.
 
     Parameters
     ----------
@@ -254,53 +264,54 @@ def final_costs(survey, costs={}):
         updated Survey class object containing the final costs of all selected targets per program
 
     """
-    tics = survey.final.tic.values.tolist()
-    for i, tic in enumerate(survey.observed.tic.values.tolist()):
-        frac = []
-        costs[i] = {}
-        costs[i]['priority'] = i+1
-        costs[i]['toi'] = str(int(np.floor(survey.observed.loc[i, "toi"])))
-        costs[i]['tic'] = str(int(tic))
-        idx = tics.index(tic)
-        nobs_goal = int(survey.final.loc[idx, "nobs_goal"])
-        costs[i]['nobs_goal'] = str(nobs_goal)
-        for science in survey.programs.index.values.tolist():
-            cost = observing.cost_function(survey.final.loc[idx], survey.programs.loc[science]['method'])
-            frac.append(cost*float(survey.final.loc[idx,'in_'+science]))
-        if float(np.sum(frac)) != 0.:
-            fractional = frac/np.sum(frac)
-        else:
-            fractional = np.zeros(len(frac))
-        for f, science in zip(fractional, survey.programs.index.values.tolist()):
-            costs[i][science] = round(((max(frac)/3600.)*f),3)
-        costs[i]['charged_time'] = round((max(frac)/3600.),3)
-        if nobs_goal == 60 or nobs_goal == 100:
-            total_cost = observing.cost_function(survey.final.loc[idx], 'hires-nobs=%d-counts=ramp'%nobs_goal, include_archival=False)
-        else:
-            total_cost = observing.cost_function(survey.final.loc[idx], 'hires-nobs=%d-counts=60'%nobs_goal, include_archival=False)
-        costs[i]['total_time'] = round(total_cost/3600.,3)
-    costs = pd.DataFrame.from_dict(costs, orient = 'index')
-    reorder = get_columns('costs', survey.sciences.name.values.tolist())
-    df = pd.DataFrame(columns = reorder)
-    for column in reorder:
-        df[column] = costs[column]
+    programs = survey.programs.index.values.tolist()
+    final = survey.final.drop_duplicates(subset='tic').set_index('tic')
+    rows = final.loc[survey.observed.tic.values]
+    teff, vmag, template, nobs = rows['teff'].values, rows['vmag'].values, rows['template'].values, rows['nobs'].values
+    nobs_goal = rows['nobs_goal'].values.astype(int)
+    # cost of each target for every program that selected it
+    frac = np.zeros((len(rows), len(programs)))
+    for j, program in enumerate(programs):
+        method = survey.specs[program]
+        cost = survey.get_instrument(method).cost_function(teff, vmag, method, template=template, nobs=nobs)
+        frac[:,j] = cost*rows['in_%s'%program].values.astype(float)
+    # the target is charged its largest (per-instrument) cost, which is split across all programs
+    total = np.sum(frac, axis=1)
+    fractional = np.divide(frac, total[:,None], out=np.zeros_like(frac), where=(total != 0.)[:,None])
+    charged = np.max(frac, axis=1, initial=0.)/3600.
+    share = charged[:,None]*fractional
+    # total time needed for the target's observing goal (without archival data)
+    total_cost = np.zeros(len(rows))
+    for counts, mask in zip(['ramp', 60.], [np.isin(nobs_goal, [60, 100]), ~np.isin(nobs_goal, [60, 100])]):
+        for goal in np.unique(nobs_goal[mask]).tolist():
+            idx = mask & (nobs_goal == goal)
+            method = MethodSpec(survey.instrument.name.lower(), goal, counts, True)
+            total_cost[idx] = survey.instrument.cost_function(teff[idx], vmag[idx], method, template=template[idx], nobs=nobs[idx], archival=False)
+    columns = get_columns('costs', survey.sciences.name.values.tolist())
+    df = pd.DataFrame(columns = columns, index = np.arange(len(rows)))
+    df['priority'] = np.arange(1, len(rows)+1).astype(object)
+    df['tic'] = [str(int(tic)) for tic in survey.observed.tic.values.tolist()]
+    df['toi'] = [str(int(np.floor(toi))) for toi in survey.observed.toi.values.tolist()]
+    for j, program in enumerate(programs):
+        df[program] = np.round(share[:,j], 3)
+    df['nobs_goal'] = [str(goal) for goal in nobs_goal.tolist()]
+    df['charged_time'] = np.round(charged, 3)
+    df['total_time'] = np.round(total_cost/3600., 3)
+    totals = df[programs+['charged_time', 'total_time']].sum(axis=0)
     idx = len(df)
-    total = df.sum(axis=0)
     df.loc[idx,'tic'] = 'Totals:'
-    for science in survey.programs.index.values.tolist():
-        df.loc[idx,science] = round(total[science],3)
-    df.loc[idx,'charged_time'] = round(total['charged_time'],3)
-    df.loc[idx,'total_time'] = round(total['total_time'],3)
-    survey.charged_time = float(total['charged_time'])
-    survey.total_time = float(total['total_time'])
+    for column in programs+['charged_time', 'total_time']:
+        df.loc[idx,column] = round(totals[column],3)
+    survey.charged_time = float(totals['charged_time'])
+    survey.total_time = float(totals['total_time'])
     if survey.save:
         if survey.emcee:
-            df.to_csv('%s/%d/total_costs.csv'%(survey.path_save,survey.n), index=False)
+            save(survey, 'total_costs', df, index=False)
         else:
             df.to_csv('%s/total_costs.csv'%survey.path_save, index=False)
         if survey.verbose and not survey.emcee:
             print('     - final costs saved')
-    survey.costs = df.copy()
+    survey.total_costs = df.copy()
     return survey
         
 
@@ -322,20 +333,17 @@ def program_overlap(survey):
     """
     columns = get_columns('overlap', survey.sciences.name.values.tolist())
     df = pd.DataFrame(columns = columns, index = survey.observed.index.values.tolist())
-    for i in survey.observed.index.values.tolist():
-        df_temp = survey.observed.loc[i]
-        df.loc[i, 'tic'] = df_temp['tic']
-        df.loc[i, 'toi'] = df_temp['toi']
-        df.loc[i, 'priority'] = df_temp['overall_priority']
-        for program in survey.programs.index.values.tolist():
-            if program in df_temp['programs']:
-                df.loc[i, 'in_'+program] = 'X'
-            else:
-                df.loc[i, 'in_'+program] = '-'
-        df.loc[i, 'total_programs'] = len(df_temp['programs'])
+    df['tic'] = survey.observed['tic'].values
+    df['toi'] = survey.observed['toi'].values
+    df['priority'] = survey.observed['overall_priority'].values
+    picks = survey.observed['programs'].explode().dropna()
+    for program in survey.programs.index.values.tolist():
+        selected = np.isin(df.index.values, picks.index.values[picks.values == program])
+        df['in_'+program] = np.where(selected, 'X', '-')
+    df['total_programs'] = survey.observed['programs'].str.len().values
     if survey.save:
         if survey.emcee:
-            df.to_csv('%s/%d/program_overlap.csv'%(survey.path_save,survey.n))
+            save(survey, 'program_overlap', df)
         else:
             df.to_csv('%s/program_overlap.csv'%survey.path_save, index = False)
         if survey.verbose and not survey.emcee:
@@ -346,42 +354,28 @@ def program_overlap(survey):
 
 def emcee_rankings(survey):
     """
-    TODO: synthesizes the selected lists across all MC iterations and counts
-    the number of times a target was selected (per number of iterations)
+    Synthesizes the selected lists across all MC iterations and counts the 
+    number of times a target was selected (per number of iterations), along
+    with its mean and median priority. The selected lists are aggregated as 
+    the iterations finish (via survey.rankings, see `aggregate.RankingAggregator`), 
+    so this only needs constant memory in the number of iterations.
 
     Parameters
     ----------
     survey : survey.Survey
-        Survey class object containing the final prioritized 'observed' list
+        Survey class object containing the aggregated 'rankings'
 
     Returns
     -------
-    survey : survey.Survey
-        updated Survey with the overlap of targets and programs
+    emcee_df : pandas.DataFrame
+        the MC summary of all selected targets
 
     """
-    columns = get_columns('emcee', survey.sciences.name.values.tolist())
-    selected = pd.DataFrame.from_dict(ranked, orient='index', columns=columns)
-    for i in selected.index.values.tolist():
-        prior = np.array(ranked[i]['priority'])
-        check = len(prior)
-        if check != selected.loc[i, 'n_select'] and survey.verbose:
-            print('WARNING for TOI %d MC counts'%int(toi))
-        selected.loc[i, 'mean'] = round(np.mean(prior),2)
-        selected.loc[i, 'median'] = int(np.percentile(prior,50.))
-    df = selected.sort_values(by = ['mean'], ascending = [True])
-    for science in survey.programs.index.values.tolist():
-        sample = Sample(df)
-        relevant = sample.in_science(science)
-        df[science] = relevant
-    for i in df.index.values.tolist():
-        total = 0
-        for science in sciences:
-            total += df.loc[i, science]
-        df.loc[i, "other_programs"] = total
-    df.to_csv('%s/TOIs_perfect_mc.csv'%survey.path_save)
-    if survey.verbose:
-        print('     - spreadsheet containing MC information saved')
+    df = survey.rankings.to_frame()
+    if survey.save:
+        write(survey, df.to_csv, '%s/TOIs_perfect_mc.csv'%survey.path_save)
+        if survey.verbose:
+            print('     - spreadsheet containing MC information saved')
     emcee_df = df.copy()
     return emcee_df
           
@@ -410,7 +404,7 @@ def get_stats(survey, note='', output='', finish=False):
     time = datetime.datetime.now()
     note += time.strftime("%a %m/%d/%y %I:%M%p") + '\n'
     output += time.strftime("%a %m/%d/%y %I:%M%p") + '\n\n'
-    note += 'Seed no: %d\n'%survey.seeds[survey.n-1]
+    note += 'Seed no: %d (stream %d)\n'%(survey.params['seed'], survey.n-1)
     note += 'Out of the %d total targets:\n'%len(df)
     output += 'Out of the %d total targets:\n'%len(df)
     for science in survey.programs.index.values.tolist():
@@ -428,11 +422,12 @@ def get_stats(survey, note='', output='', finish=False):
                 output += '  - %s has %d targets\n'%(science, 0)
     if survey.save:
         if survey.emcee:
-            f = open('%s/%d/run_info.txt'%(survey.path_save,survey.n), "w")
+            if survey.bundle is not None:
+                write(survey, survey.bundle.add_text, survey.n, 'run_info', note)
+            else:
+                write(survey, write_text, '%s/%d/run_info.txt'%(survey.path_save,survey.n), note)
         else:
-            f = open('%s/run_info.txt'%survey.path_save, "w")
-        f.write(note)
-        f.close()
+            write_text('%s/run_info.txt'%survey.path_save, note)
         if survey.verbose and not survey.emcee:
             print('     - txt file w/ run info')
             print('\n ------------------------------')
@@ -442,6 +437,50 @@ def get_stats(survey, note='', output='', finish=False):
             print(output)
 
 
+def save(survey, name, df, index=True):
+    """
+    Saves a data product of the current MC iteration, either to the iteration's 
+    directory (i.e. '<path_save>/<n>/<name>.csv') or to the survey's bundle.
+
+    Parameters
+    ----------
+    survey : survey.Survey
+        Survey class object containing algorithm selections
+    name : str
+        name of the data product
+    df : pandas.DataFrame
+        the data product
+    index : bool
+        save the index of the dataframe (csv only)
+
+    """
+    if survey.bundle is not None:
+        if index:
+            df = df.reset_index().rename(columns={'index':'row'})
+        write(survey, survey.bundle.add, survey.n, name, df)
+    else:
+        write(survey, df.to_csv, '%s/%d/%s.csv'%(survey.path_save, survey.n, name), index=index)
+
+
+def write(survey, function, *args, **kwargs):
+    """
+    Saves a data product, i.e. calls `function(*args, **kwargs)`, in the background 
+    if the survey has a data writer (see `writer.DataWriter`) and otherwise right away.
+
+    Parameters
+    ----------
+    survey : survey.Survey
+        Survey class object with an (optional) 'writer' attribute
+    function : Callable
+        the function that saves the data product, e.g. `pandas.DataFrame.to_csv`
+
+    """
+    if getattr(survey, 'writer', None) is not None:
+        survey.writer(function, *args, **kwargs)
+    else:
+        function(*args, **kwargs)
+
+
 def get_columns(type, sciences):
     """
     Get the relevant columns for different output files.
@@ -0,0 +1,108 @@
+import queue
+import threading
+
+
+
+
+class DataWriter:
+    """
+    Writes the data products of MC iterations in a background thread, so that the
+    next iteration does not wait on disk I/O. Writes are queued as (function, arguments)
+    tasks in a bounded queue, which blocks the caller when it is full (i.e. backpressure)
+    rather than holding an unbounded number of iterations in memory. The data passed to
+    the writer must not be modified afterwards.
+
+    Parameters
+    ----------
+    maxsize : int
+        maximum number of queued writes (default is `32`)
+
+    Attributes
+    ----------
+    queue : queue.Queue
+        the pending writes
+    thread : threading.Thread
+        the thread that performs the writes
+    error : Optional[Exception]
+        the first error raised by a write, which is re-raised in the calling thread
+
+    """
+
+    def __init__(self, maxsize=32):
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.error = None
+        self.thread = threading.Thread(target=self.run, name='sortasurvey-writer', daemon=True)
+        self.thread.start()
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *args):
+        self.close()
+
+
+    def __call__(self, function, *args, **kwargs):
+        """
+        Queues a write, e.g. `writer(df.to_csv, path, index=False)`.
+
+        """
+        self.check()
+        if not self.thread.is_alive():
+            raise RuntimeError("the data writer has already been closed")
+        self.queue.put((function, args, kwargs))
+
+
+    def run(self):
+        while True:
+            task = self.queue.get()
+            try:
+                if task is None:
+                    return
+                if self.error is None:
+                    function, args, kwargs = task
+                    function(*args, **kwargs)
+            except Exception as error:
+                self.error = error
+            finally:
+                self.queue.task_done()
+
+
+    def check(self):
+        """
+        Re-raises the first error of the background writes (if any).
+
+        """
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+
+
+    def flush(self):
+        """
+        Blocks until all queued writes are done.
+
+        """
+        self.queue.join()
+        self.check()
+
+
+    def close(self):
+        """
+        Writes everything that is still queued and stops the background thread.
+
+        """
+        if self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join()
+        self.check()
+
+
+def write_text(path, text):
+    """
+    Writes a string to a (new) text file.
+
+    """
+    with open(path, 'w') as f:
+        f.write(text)